@@ -1,8 +1,37 @@
+import io
 import os
+import json
+import time
+import tempfile
+import threading
 import subprocess
 import acoustid
-from typing import List, Dict, Optional
-import time
+import requests
+from typing import List, Dict, Iterator, Optional, Tuple
+from results import SampleSequence, SegmentList, format_timestamp, write_text
+from probe import get_duration
+
+
+FINGERPRINT_RATE = 11025   # chromaprint works at 11025Hz mono, so it never resamples
+SEGMENT_SECONDS = 10
+LOOKUP_BATCH_SIZE = 20     # fingerprints per AcoustID lookup request
+READ_CHUNK = 1 << 16
+
+
+class RateLimiter:
+    """Spaces calls at least min_interval seconds apart"""
+
+    def __init__(self, min_interval: float):
+        self.min_interval = min_interval
+        self.last_call = 0.0
+        self.lock = threading.Lock()
+
+    def wait(self) -> None:
+        with self.lock:
+            delay = self.last_call + self.min_interval - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            self.last_call = time.monotonic()
 
 
 class AcoustIDIdentifier:
@@ -11,20 +40,12 @@ class AcoustIDIdentifier:
     def __init__(self):
         # AcoustID public API key (free for non-commercial use)
         self.api_key = '8XaBELgH'
+        # AcoustID allows 3 requests per second
+        self.limiter = RateLimiter(acoustid.REQUEST_INTERVAL)
 
     def get_audio_duration(self, audio_path: str) -> int:
-        """Get duration of audio file in seconds using ffprobe"""
-        try:
-            cmd = [
-                'ffprobe', '-i', audio_path,
-                '-show_entries', 'format=duration',
-                '-v', 'quiet', '-of', 'csv=p=0'
-            ]
-            result = subprocess.run(cmd, capture_output=True, text=True)
-            return int(float(result.stdout.strip()))
-        except Exception as e:
-            print(f"Error getting duration: {e}")
-            return 0
+        """Get duration of audio file in seconds (probed once per file, then cached)"""
+        return get_duration(audio_path)
 
     def analyze_audio_segment(self, audio_path: str, start_time: int, duration: int = 10) -> Optional[Dict]:
         """Analyze a segment using AcoustID"""
@@ -71,66 +92,206 @@ class AcoustIDIdentifier:
                 os.remove(f"temp_segment_{start_time}.mp3")
             return None
 
-    def analyze_dj_set(self, audio_path: str, interval: int = 30) -> List[Dict]:
-        """Analyze entire DJ set"""
-        duration_seconds = self.get_audio_duration(audio_path)
+    def iter_windows(self, audio_path: str, starts: List[int], duration: int = SEGMENT_SECONDS) -> Iterator[Tuple[int, bytes]]:
+        """Decode the file once and yield (start, mono s16le PCM) for each window
 
-        if duration_seconds == 0:
-            print("Error: Could not determine audio duration")
-            return []
+        Only the part of the stream between windows is buffered, so memory
+        stays at about one window however long the set is.
+        """
+        cmd = [
+            'ffmpeg', '-nostdin', '-v', 'error', '-i', audio_path,
+            '-ac', '1',
+            '-ar', str(FINGERPRINT_RATE),
+            '-f', 's16le',
+            '-'
+        ]
+        # stderr goes to a file rather than a pipe nobody drains while we read stdout
+        errors = tempfile.TemporaryFile()
+        proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=errors)
+        bytes_per_second = FINGERPRINT_RATE * 2
+        buf = bytearray()
+        buf_start = 0  # stream offset of buf[0]
+
+        try:
+            for start in starts:
+                begin = start * bytes_per_second
+                end = begin + duration * bytes_per_second
 
-        songs = []
-        current_song = None
-        song_start_time = 0
+                while True:
+                    if buf_start < begin:
+                        drop = min(begin - buf_start, len(buf))
+                        del buf[:drop]
+                        buf_start += drop
+                    if buf_start + len(buf) >= end:
+                        break
+                    chunk = proc.stdout.read(READ_CHUNK)
+                    if not chunk:
+                        self._check_decoder(proc, cmd, errors)
+                        break
+                    buf += chunk
 
-        print(f"Analyzing {duration_seconds} seconds of audio...")
+                if buf_start < begin:
+                    return  # stream ended before this window
+                yield start, bytes(buf[:end - buf_start])
+        finally:
+            proc.stdout.close()
+            proc.kill()
+            proc.wait()
+            errors.close()
 
-        for time_pos in range(0, duration_seconds, interval):
-            print(f"Analyzing at {time_pos}s / {duration_seconds}s...")
+    @staticmethod
+    def _check_decoder(proc: subprocess.Popen, cmd: List[str], errors) -> None:
+        """At end of stream: raise if ffmpeg failed rather than letting it pass as silence"""
+        if proc.wait() != 0:
+            errors.seek(0)
+            message = errors.read().decode('utf-8', 'replace').strip()
+            raise subprocess.CalledProcessError(proc.returncode, cmd, stderr=message)
 
-            song_info = self.analyze_audio_segment(audio_path, time_pos)
+    def fingerprint_windows(self, audio_path: str, starts: List[int], duration: int = SEGMENT_SECONDS) -> Iterator[Tuple[int, str, int]]:
+        """Yield (start, fingerprint, seconds) for every window from one decode pass
 
-            if song_info:
-                song_name = f"{song_info.get('artist', 'Unknown Artist')} - {song_info.get('title', 'Unknown Title')}"
+        Uses libchromaprint in-process when pyacoustid can load it, otherwise
+        streams the windows through a single fpcalc process in chunk mode.
+        """
+        bytes_per_second = FINGERPRINT_RATE * 2
 
-                # New song detected
-                if current_song != song_name:
-                    # Save previous song if exists
-                    if current_song:
-                        songs.append({
-                            'start': song_start_time,
-                            'end': time_pos - 1,
-                            'name': current_song
-                        })
+        if acoustid.have_chromaprint:
+            for start, pcm in self.iter_windows(audio_path, starts, duration):
+                seconds = len(pcm) // bytes_per_second
+                if seconds == 0:
+                    continue
+                fingerprint = acoustid.fingerprint(FINGERPRINT_RATE, 1, iter([pcm]))
+                yield start, fingerprint.decode('ascii'), seconds
+            return
 
-                    current_song = song_name
-                    song_start_time = time_pos
+        # fpcalc splits its input into back-to-back `duration` second chunks,
+        # so feeding it only the windows gives one fingerprint per window
+        cmd = [
+            'fpcalc', '-json',
+            '-format', 's16le',
+            '-rate', str(FINGERPRINT_RATE),
+            '-channels', '1',
+            '-chunk', str(duration),
+            '-length', '0',
+            '-'
+        ]
+        fpcalc = subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+        fed = []
+        errors = []
 
-            time.sleep(0.5)  # Rate limiting
+        def feed():
+            try:
+                for start, pcm in self.iter_windows(audio_path, starts, duration):
+                    fed.append((start, len(pcm) // bytes_per_second))
+                    fpcalc.stdin.write(pcm)
+            except BrokenPipeError:
+                pass
+            except Exception as e:
+                # e.g. ffmpeg missing; re-raised below so it isn't mistaken for silence
+                errors.append(e)
+            finally:
+                fpcalc.stdin.close()
+
+        feeder = threading.Thread(target=feed, daemon=True)
+        feeder.start()
+
+        try:
+            for index, line in enumerate(fpcalc.stdout):
+                result = json.loads(line)
+                if index < len(fed) and result.get('fingerprint'):
+                    start, seconds = fed[index]
+                    yield start, result['fingerprint'], max(1, seconds)
+        finally:
+            fpcalc.stdout.close()
+            fpcalc.kill()  # unblocks the feeder if we stopped reading early
+            feeder.join()
+            fpcalc.wait()
 
-        # Add the last song
-        if current_song:
-            songs.append({
-                'start': song_start_time,
-                'end': duration_seconds,
-                'name': current_song
-            })
+        if errors:
+            raise errors[0]
 
-        return songs
+    def lookup_batch(self, windows: List[Tuple[int, str, int]]) -> Dict[int, Dict]:
+        """Look up several fingerprints in one AcoustID request; returns {start: song_info}"""
+        params = {
+            'format': 'json',
+            'client': self.api_key,
+            'meta': 'recordings'
+        }
+        for i, (start, fingerprint, seconds) in enumerate(windows):
+            params[f'fingerprint.{i}'] = fingerprint
+            params[f'duration.{i}'] = seconds
+
+        self.limiter.wait()
+        try:
+            response = requests.post(acoustid.API_BASE_URL + 'lookup', data=params, timeout=30).json()
+        except Exception as e:
+            print(f"AcoustID error: {e}")
+            return {}
+
+        if response.get('status') != 'ok':
+            print(f"AcoustID error: {response.get('error', {}).get('message', response.get('status'))}")
+            return {}
+
+        matches = {}
+        for entry in response.get('fingerprints', []):
+            start = windows[int(entry['index'])][0]
+            results = acoustid.parse_lookup_result({'status': 'ok', 'results': entry.get('results', [])})
+            for score, recording_id, title, artist in results:
+                if score > 0.5:  # Good enough match
+                    matches[start] = {
+                        'artist': artist,
+                        'title': title,
+                        'score': score
+                    }
+                    break
+
+        return matches
+
+    def analyze_dj_set(self, audio_path: str, interval: int = 30) -> SegmentList:
+        """Analyze entire DJ set: one decode pass, batched lookups"""
+        duration_seconds = self.get_audio_duration(audio_path)
+
+        if duration_seconds == 0:
+            print("Error: Could not determine audio duration")
+            return SegmentList()
+
+        starts = list(range(0, duration_seconds, interval))
+        matches = {}
+        batch = []
+
+        print(f"Analyzing {duration_seconds} seconds of audio ({len(starts)} windows)...")
+
+        try:
+            for window in self.fingerprint_windows(audio_path, starts):
+                batch.append(window)
+                if len(batch) == LOOKUP_BATCH_SIZE:
+                    print(f"Looking up windows {batch[0][0]}s - {batch[-1][0]}s / {duration_seconds}s...")
+                    matches.update(self.lookup_batch(batch))
+                    batch = []
+
+            if batch:
+                print(f"Looking up windows {batch[0][0]}s - {batch[-1][0]}s / {duration_seconds}s...")
+                matches.update(self.lookup_batch(batch))
+
+        except FileNotFoundError as e:
+            print(f"Error: {e.filename} not found. Install ffmpeg and chromaprint (brew install ffmpeg chromaprint)")
+        except acoustid.FingerprintGenerationError as e:
+            print(f"Error fingerprinting audio: {e}")
+        except subprocess.CalledProcessError as e:
+            print(f"Error decoding audio: {e.stderr.splitlines()[-1] if e.stderr else e}")
+
+        samples = SampleSequence()
+        for start in starts:
+            samples.append(start, matches.get(start))
+
+        return samples.merge(duration_seconds)
 
     def format_timestamp(self, seconds: int) -> str:
         """Convert seconds to M:SS format"""
-        minutes = seconds // 60
-        secs = seconds % 60
-        return f"{minutes}:{secs:02d}"
+        return format_timestamp(seconds)
 
-    def format_tracklist(self, songs: List[Dict]) -> str:
+    def format_tracklist(self, songs) -> str:
         """Format song list as YouTube-style timestamps"""
-        output = "TIMESTAMPS:\n\n"
-
-        for song in songs:
-            start = self.format_timestamp(song['start'])
-            end = self.format_timestamp(song['end'])
-            output += f"{start} - {end} - {song['name']}\n"
-
-        return output
+        output = io.StringIO()
+        write_text(songs, output)
+        return output.getvalue()
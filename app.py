@@ -1,8 +1,12 @@
 import os
+import uuid
 from flask import Flask, render_template, request, jsonify
 from werkzeug.utils import secure_filename
 from dotenv import load_dotenv
 from shazam_simple import SimpleShazam
+from scheduler import FairScheduler
+import worker
+import probe
 
 # Load environment variables
 load_dotenv()
@@ -14,8 +18,21 @@ app.config['UPLOAD_FOLDER'] = 'uploads'
 # Allowed audio extensions
 ALLOWED_EXTENSIONS = {'mp3', 'wav', 'm4a', 'flac', 'aac', 'ogg'}
 
+# Distributed mode: queue jobs for worker.py instead of analyzing inline
+USE_BROKER = bool(os.getenv('TRANSCRIPT_BROKER'))
+if USE_BROKER:
+    app.config['UPLOAD_FOLDER'] = worker.SPOOL_DIR
+
+# Segment recognition from all concurrent uploads shares one fair scheduler
+scheduler = FairScheduler(
+    workers=int(os.getenv('RECOGNIZER_WORKERS', 4)),
+    per_user_limit=int(os.getenv('RECOGNIZER_PER_USER', 2)),
+    min_interval=float(os.getenv('RECOGNIZER_MIN_INTERVAL', 0))
+)
+
 # Create uploads folder if it doesn't exist
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
+probe.add_transient_dir(app.config['UPLOAD_FOLDER'])
 
 
 def allowed_file(filename):
@@ -40,18 +57,24 @@ def upload_file():
     if not allowed_file(file.filename):
         return jsonify({'error': 'Invalid file type. Allowed: MP3, WAV, M4A, FLAC, AAC, OGG'}), 400
 
-    # Save file
-    filename = secure_filename(file.filename)
+    # Save file (unique name so concurrent uploads of the same file don't collide)
+    filename = f"{uuid.uuid4().hex}_{secure_filename(file.filename)}"
     filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
     file.save(filepath)
 
     # Get sampling interval (default 45 seconds for Shazam)
     interval = int(request.form.get('interval', 45))
 
+    if USE_BROKER:
+        job_id = worker.submit_job(worker.get_broker(), filepath, interval)
+        return jsonify({'success': True, 'job_id': job_id}), 202
+
     try:
         # Analyze with Shazam
         identifier = SimpleShazam()
-        songs = identifier.analyze_dj_set(filepath, interval=interval)
+        # Key the per-user cap on the connection, not a header the client controls
+        user = request.remote_addr or 'anonymous'
+        songs = identifier.analyze_dj_set(filepath, interval=interval, scheduler=scheduler, user=user)
 
         # Format output
         tracklist = identifier.format_tracklist(songs)
@@ -62,7 +85,7 @@ def upload_file():
         return jsonify({
             'success': True,
             'tracklist': tracklist,
-            'songs': songs
+            'songs': songs.to_dicts()
         })
 
     except Exception as e:
@@ -72,9 +95,30 @@ def upload_file():
         return jsonify({'error': f'Error processing file: {str(e)}'}), 500
 
 
+@app.route('/jobs/<job_id>')
+def job_status(job_id):
+    # Inline mode has no jobs; don't let a stray request create a broker DB
+    if not USE_BROKER:
+        return jsonify({'error': 'Job not found'}), 404
+
+    broker = worker.get_broker()
+    job = broker.get_job(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+
+    response = {'job_id': job_id, 'state': job['state']}
+    if job['state'] == 'running':
+        response['progress'] = {'done': broker.count_results(job_id), 'total': job['segments']}
+    elif job['state'] == 'done':
+        response.update(success=True, tracklist=job['tracklist'], songs=job['songs'])
+    elif job['state'] == 'failed':
+        response['error'] = f"Error processing file: {job.get('error')}"
+    return jsonify(response)
+
+
 @app.route('/health')
 def health():
-    return jsonify({'status': 'ok'})
+    return jsonify({'status': 'ok', 'scheduler': scheduler.stats()})
 
 
 if __name__ == '__main__':
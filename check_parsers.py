@@ -0,0 +1,240 @@
+#!/usr/bin/env python3
+"""
+Self-check for the container parsers in probe.py and seekreader.py
+Writes tiny synthetic MP3 (ID3 + Xing), FLAC (STREAMINFO + SEEKTABLE) and
+MP4/M4A (moov after mdat, esds, stsc runs) files and checks what the
+parsers read back, including the ADTS headers MP4Index puts in front of
+each AAC frame. Needs neither ffmpeg nor real audio.
+
+Usage:
+    python check_parsers.py
+"""
+
+import os
+import sys
+import struct
+import tempfile
+
+from probe import parse_mp3_header, id3v2_size, iter_mp3_frames, probe_mp3, flac_has_seektable
+from seekreader import MP3Index, FLACIndex, MP4Index, PREROLL_FRAMES, build_index
+
+
+failures = []
+
+
+def expect(what: str, actual, expected) -> None:
+    if actual == expected:
+        print(f"✅ {what}")
+    else:
+        print(f"❌ {what}: got {actual!r}, expected {expected!r}")
+        failures.append(what)
+
+
+# --- MP3 ---------------------------------------------------------------------
+
+MP3_HEADER = bytes([0xFF, 0xFB, 0x90, 0xC0])   # MPEG-1 layer III, 128kbps, 44.1kHz, mono
+MP3_FRAME_LENGTH = 144 * 128000 // 44100       # 417 bytes, no padding
+
+
+def mp3_frame(xing: bytes = b'') -> bytes:
+    # Mono MPEG-1 side info is 17 bytes, so a Xing tag starts 21 bytes in
+    body = MP3_HEADER + bytes(17) + xing
+    return body + bytes(MP3_FRAME_LENGTH - len(body))
+
+
+def write_mp3(path: str, frames: int, xing_frames: int, xing_bytes_delta: int = 0) -> int:
+    """ID3v2 tag, a stray 0xFF, a Xing frame and frames-1 plain frames; returns the first frame offset"""
+    id3 = b'ID3' + bytes([3, 0, 0, 0, 0, 0, 20]) + bytes(20)
+    junk = b'\xff\x00'
+    stream_bytes = frames * MP3_FRAME_LENGTH + xing_bytes_delta
+    xing = b'Xing' + struct.pack('>III', 3, xing_frames, stream_bytes)
+    with open(path, 'wb') as f:
+        f.write(id3 + junk + mp3_frame(xing) + mp3_frame() * (frames - 1))
+    return len(id3) + len(junk)
+
+
+def check_mp3(tmp: str) -> None:
+    frame = parse_mp3_header(MP3_HEADER)
+    expect("mp3 header fields", (frame.version, frame.layer, frame.bitrate, frame.sample_rate,
+                                 frame.channels, frame.samples, frame.length),
+           (1, 3, 128, 44100, 1, 1152, MP3_FRAME_LENGTH))
+    expect("mp3 free-format/reserved header rejected", parse_mp3_header(b'\xff\xfb\x00\xc0'), None)
+
+    path = os.path.join(tmp, 'xing.mp3')
+    first = write_mp3(path, frames=10, xing_frames=20)
+    with open(path, 'rb') as f:
+        data = f.read()
+    expect("id3v2 size", id3v2_size(data[:10]), 30)
+    expect("frame walk skips junk", [offset for offset, _ in iter_mp3_frames(data, 30)],
+           [first + i * MP3_FRAME_LENGTH for i in range(10)])
+
+    # The Xing frame count (20) is trusted when its byte count matches the file
+    info = probe_mp3(path)
+    expect("xing duration", (info.source, round(info.duration, 4)), ('mp3-header', round(20 * 1152 / 44100, 4)))
+
+    # ...and ignored in favour of a frame walk when it doesn't
+    write_mp3(path, frames=10, xing_frames=20, xing_bytes_delta=1000)
+    info = probe_mp3(path)
+    expect("stale xing ignored", (info.source, round(info.duration, 4)), ('mp3-frames', round(10 * 1152 / 44100, 4)))
+
+    index = MP3Index(path)
+    expect("mp3 index offsets", list(index.offsets), [first + i * MP3_FRAME_LENGTH for i in range(11)])
+    expect("mp3 index positions", list(index.positions), [i * 1152 for i in range(11)])
+
+    # Frame 5 holds t=0.14s; the chunk starts PREROLL_FRAMES earlier
+    data, start = index.chunk(0.14, 0.2)
+    first_frame = 5 - PREROLL_FRAMES
+    expect("mp3 chunk start", start, first_frame * 1152 / 44100)
+    expect("mp3 chunk length", len(data), (8 - first_frame) * MP3_FRAME_LENGTH)
+
+
+# --- FLAC --------------------------------------------------------------------
+
+def write_flac(path: str, seektable: bool, total_samples: int = 441000) -> int:
+    """STREAMINFO (+ SEEKTABLE) then 1000 bytes of 'frames'; returns where audio starts"""
+    packed = (44100 << 44) | (0 << 41) | (15 << 36) | total_samples
+    streaminfo = bytes(10) + packed.to_bytes(8, 'big') + bytes(16)
+    points = struct.pack('>QQH', 0, 0, 4096) + struct.pack('>QQH', 220500, 600, 4096)
+    points += struct.pack('>QQH', 0xFFFFFFFFFFFFFFFF, 0, 0)  # placeholder
+
+    blocks = [(0, streaminfo)] + ([(3, points)] if seektable else [])
+    out = b'fLaC'
+    for i, (block_type, data) in enumerate(blocks):
+        last = 0x80 if i == len(blocks) - 1 else 0
+        out += bytes([last | block_type]) + len(data).to_bytes(3, 'big') + data
+    with open(path, 'wb') as f:
+        f.write(out + bytes(range(256)) * 3 + bytes(232))
+    return len(out)
+
+
+def check_flac(tmp: str) -> None:
+    path = os.path.join(tmp, 'plain.flac')
+    write_flac(path, seektable=False)
+    expect("flac without seektable", flac_has_seektable(path), False)
+    try:
+        FLACIndex(path)
+        expect("flac index needs a seektable", 'built', 'ValueError')
+    except ValueError:
+        expect("flac index needs a seektable", 'ValueError', 'ValueError')
+
+    path = os.path.join(tmp, 'seek.flac')
+    audio_start = write_flac(path, seektable=True)
+    expect("flac with seektable", flac_has_seektable(path), True)
+
+    index = FLACIndex(path)
+    expect("flac sample rate", index.sample_rate, 44100)
+    expect("flac seekpoints (placeholder dropped)", list(index.positions), [0, 220500, 441000])
+    expect("flac offsets", list(index.offsets), [audio_start, audio_start + 600, audio_start + 1000])
+
+    with open(path, 'rb') as f:
+        f.seek(audio_start + 600)
+        second_half = f.read()
+    data, start = index.chunk(6.0, 8.0)
+    expect("flac chunk start", start, 5.0)
+    expect("flac chunk is header + second half", data, index.header + second_half)
+    expect("flac chunk header", index.header[:8], b'fLaC\x80\x00\x00\x22')
+
+    # Half a second sits between seekpoints 5s apart: reading 5s of frames for it
+    # is past MAX_SPAN_FACTOR, so the reader is told to use ffmpeg seeking
+    expect("sparse flac seektable falls back", index.chunk(6.0, 6.5), None)
+
+
+# --- MP4 / ADTS --------------------------------------------------------------
+
+def box(kind: bytes, *payload: bytes) -> bytes:
+    body = b''.join(payload)
+    return struct.pack('>I4s', 8 + len(body), kind) + body
+
+
+def descriptor(tag: int, body: bytes) -> bytes:
+    return bytes([tag, 0x80, 0x80, 0x80, len(body)]) + body   # padded 4-byte length, like ffmpeg writes
+
+
+def write_m4a(path: str, sizes, chunks, stsc=((1, 2, 1), (3, 1, 1))) -> list:
+    """ftyp, mdat, then moov (so the index has to skip mdat); returns chunk offsets"""
+    ftyp = box(b'ftyp', b'M4A ', bytes(4), b'isomM4A ')
+    samples = b''.join(bytes([i + 1]) * size for i, size in enumerate(sizes))
+    mdat = box(b'mdat', samples)
+
+    # default stsc runs: chunks 1-2 hold two samples each, chunk 3 holds one
+    offsets, pos = [], len(ftyp) + 8
+    sample = 0
+    for per_chunk in chunks:
+        offsets.append(pos)
+        pos += sum(sizes[sample:sample + per_chunk])
+        sample += per_chunk
+
+    asc = ((2 << 11) | (4 << 7) | (1 << 3)).to_bytes(2, 'big')   # AAC-LC, 44.1kHz, mono
+    esds = box(b'esds', bytes(4), descriptor(3, struct.pack('>HB', 1, 0)
+                                             + descriptor(4, bytes([0x40, 0x15]) + bytes(11)
+                                                          + descriptor(5, asc))))
+    mp4a = box(b'mp4a', bytes(6), struct.pack('>H', 1), bytes(8), struct.pack('>HHHH', 1, 16, 0, 0),
+               struct.pack('>I', 44100 << 16), esds)
+    stbl = box(b'stbl',
+               box(b'stsd', struct.pack('>II', 0, 1), mp4a),
+               box(b'stts', struct.pack('>III', 0, 1, len(sizes)), struct.pack('>I', 1024)),
+               box(b'stsc', struct.pack('>II', 0, len(stsc)), *(struct.pack('>III', *run) for run in stsc)),
+               box(b'stsz', struct.pack('>III', 0, 0, len(sizes)), struct.pack(f'>{len(sizes)}I', *sizes)),
+               box(b'stco', struct.pack('>II', 0, len(offsets)), struct.pack(f'>{len(offsets)}I', *offsets)))
+    mdia = box(b'mdia',
+               box(b'mdhd', bytes(12), struct.pack('>II', 44100, 1024 * len(sizes)), bytes(4)),
+               box(b'hdlr', bytes(8), b'soun', bytes(13)),
+               box(b'minf', stbl))
+    moov = box(b'moov', box(b'trak', mdia))
+
+    with open(path, 'wb') as f:
+        f.write(ftyp + mdat + moov)
+    return offsets
+
+
+def parse_adts(header: bytes):
+    """(syncword, profile, rate index, channel config, frame length) of a 7-byte ADTS header"""
+    bits = int.from_bytes(header, 'big')
+    return (bits >> 44, (bits >> 38) & 3, (bits >> 34) & 0xF, (bits >> 30) & 7, (bits >> 13) & 0x1FFF)
+
+
+def check_mp4(tmp: str) -> None:
+    path = os.path.join(tmp, 'track.m4a')
+    sizes = [10, 20, 30, 40, 50]
+    chunk_offsets = write_m4a(path, sizes, chunks=[2, 2, 1])
+
+    index = MP4Index(path)
+    expect("mp4 timescale", index.sample_rate, 44100)
+    expect("esds audio config", (index.profile, index.rate_index, index.channel_config), (1, 4, 1))
+    expect("mp4 sample offsets", list(index.offsets),
+           [chunk_offsets[0], chunk_offsets[0] + 10, chunk_offsets[1], chunk_offsets[1] + 30, chunk_offsets[2]])
+    expect("mp4 sample positions", list(index.positions), [i * 1024 for i in range(6)])
+
+    header = index.adts_header(100)
+    expect("adts header length", len(header), 7)
+    expect("adts fields", parse_adts(header), (0xFFF, 1, 4, 1, 107))
+
+    data, start = index.chunk(0, 5 * 1024 / 44100)
+    expect("mp4 chunk start", start, 0.0)
+    frames, pos = [], 0
+    while pos < len(data):
+        length = parse_adts(data[pos:pos + 7])[4]
+        frames.append(data[pos + 7:pos + length])
+        pos += length
+    expect("mp4 chunk frames", frames, [bytes([i + 1]) * size for i, size in enumerate(sizes)])
+
+    # An stsc run pointing past the last chunk must mean "no index", not a crash
+    path = os.path.join(tmp, 'broken.m4a')
+    write_m4a(path, sizes, chunks=[2, 2, 1], stsc=((1, 2, 1), (3, 1, 1), (5, 1, 1)))
+    expect("malformed m4a falls back to ffmpeg seeking", build_index(path), None)
+
+
+def main():
+    with tempfile.TemporaryDirectory(prefix='transcriptsongs_check_') as tmp:
+        check_mp3(tmp)
+        check_flac(tmp)
+        check_mp4(tmp)
+
+    if failures:
+        print(f"\n{len(failures)} check(s) failed")
+        sys.exit(1)
+    print("\nAll parser checks passed")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,22 +1,33 @@
 #!/usr/bin/env python3
 """
 Command-line interface using Shazam for better accuracy
-Usage: python cli_shazam.py path/to/djset.mp3
+Usage: python cli_shazam.py path/to/djset.mp3 [interval_seconds] [--profile] [--format=text|json|csv|cue]
 """
 
 import sys
 import os
 from shazam_identifier import ShazamIdentifier
+from profiler import Profiler
+from results import WRITERS, EXTENSIONS, write_tracklist
 
 
 def main():
-    if len(sys.argv) < 2:
-        print("Usage: python cli_shazam.py <audio_file_path> [interval_seconds]")
+    options = [arg for arg in sys.argv[1:] if arg.startswith('--')]
+    args = [arg for arg in sys.argv[1:] if not arg.startswith('--')]
+    profile = '--profile' in options
+    output_format = next((opt.split('=', 1)[1] for opt in options if opt.startswith('--format=')), 'text')
+
+    if output_format not in WRITERS:
+        print(f"Error: Unknown format {output_format} (choose from: {', '.join(WRITERS)})")
+        sys.exit(1)
+
+    if len(args) < 1:
+        print("Usage: python cli_shazam.py <audio_file_path> [interval_seconds] [--profile] [--format=text|json|csv|cue]")
         print("Example: python cli_shazam.py my_djset.mp3 30")
         sys.exit(1)
 
-    audio_path = sys.argv[1]
-    interval = int(sys.argv[2]) if len(sys.argv) > 2 else 30
+    audio_path = args[0]
+    interval = int(args[1]) if len(args) > 1 else 30
 
     if not os.path.exists(audio_path):
         print(f"Error: File not found: {audio_path}")
@@ -26,19 +37,34 @@ def main():
     print(f"Sampling interval: {interval} seconds\n")
 
     identifier = ShazamIdentifier()
+    profiler = None
+    if profile:
+        profiler = Profiler()
+        profiler.attach(identifier)
+        profiler.start()
+
     songs = identifier.analyze_dj_set(audio_path, interval=interval)
 
+    if profiler:
+        profiler.stop()
+
     print("\n" + "="*60)
     print(identifier.format_tracklist(songs))
     print("="*60)
 
     # Save to file
-    output_file = audio_path.rsplit('.', 1)[0] + '_tracklist.txt'
-    with open(output_file, 'w') as f:
-        f.write(identifier.format_tracklist(songs))
+    output_file = audio_path.rsplit('.', 1)[0] + '_tracklist.' + EXTENSIONS[output_format]
+    with open(output_file, 'w', newline='') as f:
+        write_tracklist(songs, f, output_format, os.path.basename(audio_path))
 
     print(f"\n✅ Tracklist saved to: {output_file}")
 
+    if profiler:
+        profile_file = audio_path.rsplit('.', 1)[0] + '_profile.folded'
+        profiler.write_collapsed(profile_file)
+        print("\n" + profiler.summary())
+        print(f"🔥 Profile saved to: {profile_file} (open in speedscope.app or flamegraph.pl)")
+
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,310 @@
+#!/usr/bin/env python3
+"""
+Load test for the Flask /upload path
+Starts app.py in a child process with Shazam replaced by a latency-injecting
+stub, replays synthetic audio uploads at a fixed concurrency and reports
+throughput, latency and time-to-first-result percentiles, peak RSS, open fds
+and temp disk usage.
+
+Usage:
+    python loadtest.py --requests 40 --concurrency 8 --lengths 60,300,1800
+    python loadtest.py --stub-decode ...   # also skip ffmpeg/ffprobe in the app
+
+Resource numbers are read from /proc, so they are only available on Linux.
+"""
+
+import os
+import sys
+import math
+import time
+import wave
+import array
+import random
+import shutil
+import socket
+import argparse
+import tempfile
+import threading
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Optional
+
+import requests
+
+
+def write_synthetic_wav(path: str, seconds: int, sample_rate: int = 44100, seed: int = 0) -> None:
+    """Write a mono WAV of back-to-back tones, one second at a time"""
+    rng = random.Random(seed)
+    with wave.open(path, 'wb') as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(sample_rate)
+
+        # A new "track" (tone) every 30s so the stub sees changing content
+        for second in range(seconds):
+            if second % 30 == 0:
+                freq = rng.uniform(110, 880)
+                tone = array.array('h', (
+                    int(8000 * math.sin(2 * math.pi * freq * i / sample_rate))
+                    for i in range(sample_rate)
+                ))
+                if sys.byteorder == 'big':
+                    tone.byteswap()
+                chunk = tone.tobytes()
+            wav.writeframes(chunk)
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of an unsorted list"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def dir_size(path: str) -> int:
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass  # temp file removed while walking
+    return total
+
+
+def read_proc_status(pid: int) -> Dict[str, int]:
+    """VmRSS/VmHWM (kB) from /proc/<pid>/status"""
+    fields = {}
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                key, _, value = line.partition(':')
+                if key in ('VmRSS', 'VmHWM'):
+                    fields[key] = int(value.split()[0])
+    except OSError:
+        pass
+    return fields
+
+
+def count_fds(pid: int) -> Optional[int]:
+    try:
+        return len(os.listdir(f"/proc/{pid}/fd"))
+    except OSError:
+        return None
+
+
+class ResourceSampler(threading.Thread):
+    """Polls the server process for RSS, open fds and temp disk usage"""
+
+    def __init__(self, pid: int, work_dir: str, interval: float = 0.1):
+        super().__init__(daemon=True)
+        self.pid = pid
+        self.work_dir = work_dir
+        self.interval = interval
+        self.peak_rss_kb = 0
+        self.peak_fds = 0
+        self.peak_disk = 0
+        self.stopped = threading.Event()
+
+    def run(self) -> None:
+        while not self.stopped.is_set():
+            self.sample()
+            self.stopped.wait(self.interval)
+
+    def sample(self) -> None:
+        status = read_proc_status(self.pid)
+        self.peak_rss_kb = max(self.peak_rss_kb, status.get('VmHWM', 0), status.get('VmRSS', 0))
+        self.peak_fds = max(self.peak_fds, count_fds(self.pid) or 0)
+        self.peak_disk = max(self.peak_disk, dir_size(self.work_dir))
+
+    def stop(self) -> None:
+        self.stopped.set()
+        self.join()
+        self.sample()
+
+
+def serve(port: int, latency_min: float, latency_max: float, stub_decode: bool) -> None:
+    """Child process: run app.py with the recognizer (and optionally ffmpeg) stubbed"""
+    import asyncio
+    from shazam_simple import SimpleShazam
+
+    async def stub_recognize(self, segment_path: str) -> Optional[Dict]:
+        await asyncio.sleep(random.uniform(latency_min, latency_max))
+        size = os.path.getsize(segment_path)
+        return {'artist': 'Load Test', 'title': f"Track {size % 7}"}
+
+    SimpleShazam.recognize_segment_async = stub_recognize
+
+    if stub_decode:
+        def stub_duration(self, audio_path: str) -> int:
+            with wave.open(audio_path) as wav:
+                return wav.getnframes() // wav.getframerate()
+
+        def stub_segment(self, audio_path: str, start_time: int, duration: int = 12) -> Optional[Dict]:
+            temp_file = f"temp_shazam_{threading.get_ident()}_{start_time}.wav"
+            try:
+                with wave.open(audio_path) as src:
+                    src.setpos(min(start_time * src.getframerate(), src.getnframes()))
+                    frames = src.readframes(duration * src.getframerate())
+                    with wave.open(temp_file, 'wb') as dst:
+                        dst.setparams(src.getparams())
+                        dst.writeframes(frames)
+                return asyncio.run(self.recognize_segment_async(temp_file))
+            finally:
+                if os.path.exists(temp_file):
+                    os.remove(temp_file)
+
+        SimpleShazam.get_audio_duration = stub_duration
+        SimpleShazam.analyze_audio_segment = stub_segment
+
+    # Silence the per-segment progress output
+    sys.stdout = open(os.devnull, 'w')
+
+    from app import app
+    app.run(host='127.0.0.1', port=port, threaded=True, debug=False)
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def wait_for_server(url: str, proc: subprocess.Popen, timeout: float = 30) -> None:
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"Server exited with code {proc.returncode}")
+        try:
+            if requests.get(f"{url}/health", timeout=1).ok:
+                return
+        except requests.RequestException:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError("Server did not start in time")
+
+
+def run_load(args) -> None:
+    lengths = [int(x) for x in args.lengths.split(',')]
+    work_dir = tempfile.mkdtemp(prefix='transcriptsongs_load_')
+    fixtures_dir = tempfile.mkdtemp(prefix='transcriptsongs_fixtures_')
+    app_dir = os.path.dirname(os.path.abspath(__file__))
+
+    print(f"Generating synthetic uploads: {', '.join(f'{n}s' for n in lengths)}")
+    fixtures = []
+    for i, seconds in enumerate(lengths):
+        path = os.path.join(fixtures_dir, f"synthetic_{seconds}s.wav")
+        write_synthetic_wav(path, seconds, args.sample_rate, seed=args.seed + i)
+        fixtures.append(path)
+
+    port = free_port()
+    url = f"http://127.0.0.1:{port}"
+    env = dict(os.environ, PYTHONPATH=app_dir + os.pathsep + os.environ.get('PYTHONPATH', ''))
+    env.pop('TRANSCRIPT_BROKER', None)  # always exercise the inline path
+    env['TRANSCRIPT_PROBE_CACHE'] = os.path.join(work_dir, 'probe.json')  # keep ~/.cache untouched
+    # Every client connects from 127.0.0.1, i.e. as one user, so the per-user
+    # cap would otherwise throttle the whole run
+    env.setdefault('RECOGNIZER_PER_USER', env.get('RECOGNIZER_WORKERS', '4'))
+    cmd = [
+        sys.executable, os.path.abspath(__file__), '--serve',
+        '--port', str(port),
+        '--latency', f"{args.latency_min},{args.latency_max}"
+    ]
+    if args.stub_decode:
+        cmd.append('--stub-decode')
+
+    # The app writes uploads/ and temp segments relative to its cwd
+    proc = subprocess.Popen(cmd, cwd=work_dir, env=env)
+    latencies = []
+    errors = 0
+    empty = 0
+
+    try:
+        wait_for_server(url, proc)
+        sampler = ResourceSampler(proc.pid, work_dir)
+        sampler.start()
+
+        def upload(n: int):
+            path = fixtures[n % len(fixtures)]
+            started = time.perf_counter()
+            try:
+                with open(path, 'rb') as f:
+                    response = requests.post(
+                        f"{url}/upload",
+                        files={'file': (os.path.basename(path), f, 'audio/wav')},
+                        data={'interval': args.interval},
+                        timeout=args.timeout
+                    )
+                if not response.ok:
+                    status = 'error'
+                elif not response.json().get('songs'):
+                    # A 200 with no songs means the pipeline silently lost every segment
+                    status = 'empty'
+                else:
+                    status = 'ok'
+            except (requests.RequestException, ValueError):
+                status = 'error'
+            return time.perf_counter() - started, status
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+            for elapsed, status in pool.map(upload, range(args.requests)):
+                if status == 'ok':
+                    latencies.append(elapsed)
+                elif status == 'empty':
+                    empty += 1
+                else:
+                    errors += 1
+        wall = time.perf_counter() - started
+        sampler.stop()
+        scheduler_stats = requests.get(f"{url}/health", timeout=5).json().get('scheduler', {})
+
+    finally:
+        proc.terminate()
+        proc.wait()
+        shutil.rmtree(work_dir, ignore_errors=True)
+        shutil.rmtree(fixtures_dir, ignore_errors=True)
+
+    print("\n" + "="*60)
+    print(f"Requests:      {args.requests} ({errors} failed, {empty} with no songs) at concurrency {args.concurrency}")
+    print(f"Wall time:     {wall:.1f}s")
+    print(f"Throughput:    {len(latencies) / wall:.2f} req/s")
+    for pct in (50, 90, 95, 99):
+        print(f"Latency p{pct}:   {percentile(latencies, pct):.2f}s")
+    print(f"Latency max:   {max(latencies, default=0):.2f}s")
+    for key in ('first_result_p50', 'first_result_p95'):
+        if scheduler_stats.get(key) is not None:
+            print(f"First result p{key[-2:]}: {scheduler_stats[key]:.2f}s")
+    print(f"Peak RSS:      {sampler.peak_rss_kb / 1024:.1f} MB")
+    print(f"Peak open fds: {sampler.peak_fds}")
+    print(f"Peak temp disk: {sampler.peak_disk / 1024 / 1024:.1f} MB")
+    print("="*60)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the /upload path with a stubbed recognizer")
+    parser.add_argument('--requests', type=int, default=20, help="total uploads to send")
+    parser.add_argument('--concurrency', type=int, default=4, help="uploads in flight at once")
+    parser.add_argument('--lengths', default='60,300', help="comma-separated upload lengths in seconds (cycled)")
+    parser.add_argument('--interval', type=int, default=45, help="sampling interval sent with each upload")
+    parser.add_argument('--latency', default='0.5,1.5', help="stub recognizer latency range in seconds, min,max")
+    parser.add_argument('--sample-rate', type=int, default=44100)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--timeout', type=float, default=3600, help="per-request timeout in seconds")
+    parser.add_argument('--stub-decode', action='store_true', help="also replace ffprobe/ffmpeg with WAV slicing")
+    parser.add_argument('--serve', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--port', type=int, default=0, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    args.latency_min, args.latency_max = (float(x) for x in args.latency.split(','))
+
+    if args.serve:
+        serve(args.port, args.latency_min, args.latency_max, args.stub_decode)
+    else:
+        run_load(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,400 @@
+"""
+Audio probing with a metadata cache
+One ffprobe call gets every stream field we need, keyed by file identity
+(path, size, mtime) so reruns never spawn it again. MP3s are read straight
+from their frame headers (Xing/Info/VBRI, or a full frame walk when there is
+no VBR header), and anything whose container reports no duration falls back
+to a decoded sample count.
+"""
+
+import os
+import re
+import json
+import mmap
+import struct
+import threading
+import subprocess
+from collections import OrderedDict
+from dataclasses import dataclass, asdict
+from typing import Dict, Iterator, List, Optional, Tuple
+
+
+CACHE_PATH = os.getenv('TRANSCRIPT_PROBE_CACHE',
+                       os.path.join(os.path.expanduser('~'), '.cache', 'transcriptsongs', 'probe.json'))
+CACHE_ENTRIES = 1000   # least recently used entries are evicted past this
+CACHE_VERSION = 1      # bump when AudioInfo's fields change; older cache files are dropped
+
+
+@dataclass
+class AudioInfo:
+    duration: float
+    sample_rate: int
+    channels: int
+    codec: str
+    channel_layout: str = ''
+    bit_rate: int = 0
+    format_name: str = ''
+    seekable: bool = False   # container carries a seek index (Xing TOC, FLAC SEEKTABLE, MP4 sample tables...)
+    source: str = 'ffprobe'  # ffprobe | mp3-header | mp3-frames | decoded
+
+
+# --- MP3 frame headers -------------------------------------------------------
+
+MP3_BITRATES = {
+    (1, 1): (0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448),
+    (1, 2): (0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384),
+    (1, 3): (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320),
+    (2, 1): (0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256),
+    (2, 2): (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+    (2, 3): (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+}
+MP3_SAMPLE_RATES = {1: (44100, 48000, 32000), 2: (22050, 24000, 16000), 2.5: (11025, 12000, 8000)}
+
+
+@dataclass
+class MP3Frame:
+    version: float     # 1, 2 or 2.5
+    layer: int
+    bitrate: int       # kbps
+    sample_rate: int
+    channels: int
+    samples: int       # PCM samples per channel in this frame
+    length: int        # bytes, header included
+
+
+def parse_mp3_header(data: bytes) -> Optional[MP3Frame]:
+    """Decode a 4-byte MPEG audio frame header, None if it isn't one"""
+    if len(data) < 4 or data[0] != 0xFF or data[1] & 0xE0 != 0xE0:
+        return None
+
+    version = {0: 2.5, 2: 2, 3: 1}.get((data[1] >> 3) & 3)
+    layer = {1: 3, 2: 2, 3: 1}.get((data[1] >> 1) & 3)
+    bitrate_index = data[2] >> 4
+    rate_index = (data[2] >> 2) & 3
+    if version is None or layer is None or bitrate_index in (0, 15) or rate_index == 3:
+        return None
+
+    bitrate = MP3_BITRATES[(1 if version == 1 else 2, layer)][bitrate_index]
+    sample_rate = MP3_SAMPLE_RATES[version][rate_index]
+    padding = (data[2] >> 1) & 1
+    channels = 1 if data[3] >> 6 == 3 else 2
+
+    if layer == 1:
+        samples = 384
+        length = (12 * bitrate * 1000 // sample_rate + padding) * 4
+    elif layer == 2 or version == 1:
+        samples = 1152
+        length = 144 * bitrate * 1000 // sample_rate + padding
+    else:
+        samples = 576
+        length = 72 * bitrate * 1000 // sample_rate + padding
+
+    return MP3Frame(version, layer, bitrate, sample_rate, channels, samples, length)
+
+
+def id3v2_size(data: bytes) -> int:
+    """Bytes taken by a leading ID3v2 tag (0 if none)"""
+    if len(data) < 10 or data[:3] != b'ID3':
+        return 0
+    size = (data[6] << 21) | (data[7] << 14) | (data[8] << 7) | data[9]
+    footer = 10 if data[5] & 0x10 else 0
+    return 10 + size + footer
+
+
+def iter_mp3_frames(buf, start: int = 0) -> Iterator[Tuple[int, MP3Frame]]:
+    """Walk (offset, frame) over a bytes-like MP3 body, resyncing past junk"""
+    pos = start
+    end = len(buf)
+
+    while pos + 4 <= end:
+        frame = parse_mp3_header(buf[pos:pos + 4])
+        if frame is None or frame.length < 4:
+            if buf[pos:pos + 3] == b'TAG' and end - pos <= 128:
+                return  # ID3v1 trailer
+            nxt = buf.find(b'\xff', pos + 1)
+            if nxt < 0:
+                return
+            pos = nxt
+            continue
+
+        nxt = pos + frame.length
+        if nxt > end:
+            return  # truncated last frame
+
+        # Require the next header to line up, so stray 0xFF bytes in junk
+        # don't count as frames
+        if nxt + 4 <= end and parse_mp3_header(buf[nxt:nxt + 4]) is None and buf[nxt:nxt + 3] != b'TAG':
+            nxt = buf.find(b'\xff', pos + 1)
+            if nxt < 0:
+                return
+            pos = nxt
+            continue
+
+        yield pos, frame
+        pos = nxt
+
+
+def read_vbr_header(buf, offset: int, frame: MP3Frame) -> Tuple[Optional[int], Optional[int], bool]:
+    """Frame count, stream byte count and TOC presence from a Xing/Info or VBRI header"""
+    if frame.version == 1:
+        side_info = 17 if frame.channels == 1 else 32
+    else:
+        side_info = 9 if frame.channels == 1 else 17
+
+    xing = offset + 4 + side_info
+    if buf[xing:xing + 4] in (b'Xing', b'Info'):
+        flags = struct.unpack('>I', buf[xing + 4:xing + 8])[0]
+        pos = xing + 8
+        frames = size = None
+        if flags & 1:
+            frames = struct.unpack('>I', buf[pos:pos + 4])[0]
+            pos += 4
+        if flags & 2:
+            size = struct.unpack('>I', buf[pos:pos + 4])[0]
+        return frames, size, bool(flags & 4)
+
+    vbri = offset + 36
+    if buf[vbri:vbri + 4] == b'VBRI':
+        size, frames = struct.unpack('>II', buf[vbri + 10:vbri + 18])
+        return frames, size, True
+
+    return None, None, False
+
+
+def probe_mp3(path: str) -> Optional[AudioInfo]:
+    """Duration and stream info from MP3 frame headers, without spawning anything
+
+    Trusts a Xing/Info/VBRI frame count when there is one; otherwise counts
+    every frame, since the bitrate-based estimate is wrong for headerless VBR.
+    """
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return None
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+            frames = iter_mp3_frames(buf, id3v2_size(buf[:10]))
+            first = next(frames, None)
+            if first is None:
+                return None
+
+            offset, frame = first
+            info = AudioInfo(
+                duration=0.0,
+                sample_rate=frame.sample_rate,
+                channels=frame.channels,
+                codec='mp3',
+                channel_layout='mono' if frame.channels == 1 else 'stereo',
+                format_name='mp3'
+            )
+
+            # A VBR header whose byte count doesn't match the file was written
+            # for a different (cut or re-tagged) stream, so don't trust it
+            frame_count, stream_bytes, has_toc = read_vbr_header(buf, offset, frame)
+            if stream_bytes and abs(stream_bytes - (len(buf) - offset)) > 0.05 * stream_bytes:
+                frame_count = None
+
+            if frame_count:
+                info.duration = frame_count * frame.samples / frame.sample_rate
+                info.bit_rate = int(8 * (len(buf) - offset) / info.duration) if info.duration else 0
+                info.seekable = has_toc
+                info.source = 'mp3-header'
+                return info
+
+            total_samples = frame.samples
+            total_bytes = frame.length
+            for _, frame in frames:
+                total_samples += frame.samples
+                total_bytes += frame.length
+
+            info.duration = total_samples / info.sample_rate
+            info.bit_rate = int(8 * total_bytes / info.duration) if info.duration else 0
+            info.source = 'mp3-frames'
+            return info
+
+
+# --- other containers ---------------------------------------------------------
+
+def flac_has_seektable(path: str) -> bool:
+    """Whether the FLAC metadata blocks include a SEEKTABLE"""
+    try:
+        with open(path, 'rb') as f:
+            if f.read(4) != b'fLaC':
+                return False
+            while True:
+                header = f.read(4)
+                if len(header) < 4:
+                    return False
+                block_type = header[0] & 0x7F
+                if block_type == 3:
+                    return True
+                if header[0] & 0x80:
+                    return False  # last metadata block
+                f.seek(int.from_bytes(header[1:], 'big'), os.SEEK_CUR)
+    except OSError:
+        return False
+
+
+def decoded_duration(path: str) -> float:
+    """Decode the whole first audio stream and read the final timestamp"""
+    cmd = ['ffmpeg', '-nostdin', '-i', path, '-map', '0:a:0', '-f', 'null', '-']
+    result = subprocess.run(cmd, capture_output=True, text=True)
+    times = re.findall(r'time=(\d+):(\d+):(\d+(?:\.\d+)?)', result.stderr)
+    if not times:
+        return 0.0
+    hours, minutes, seconds = times[-1]
+    return int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+
+
+def ffprobe(path: str) -> Optional[AudioInfo]:
+    """Every field we need from the first audio stream, in one ffprobe call"""
+    cmd = [
+        'ffprobe', '-v', 'quiet',
+        '-print_format', 'json',
+        '-show_format', '-show_streams',
+        '-select_streams', 'a:0',
+        path
+    ]
+    result = subprocess.run(cmd, capture_output=True, text=True)
+    data = json.loads(result.stdout or '{}')
+    streams = data.get('streams') or []
+    if not streams:
+        return None
+
+    stream = streams[0]
+    fmt = data.get('format', {})
+    format_name = fmt.get('format_name', '')
+    duration = float(stream.get('duration') or fmt.get('duration') or 0)
+
+    info = AudioInfo(
+        duration=duration,
+        sample_rate=int(stream.get('sample_rate') or 0),
+        channels=int(stream.get('channels') or 0),
+        codec=stream.get('codec_name', ''),
+        channel_layout=stream.get('channel_layout', ''),
+        bit_rate=int(stream.get('bit_rate') or fmt.get('bit_rate') or 0),
+        format_name=format_name
+    )
+
+    if 'flac' in format_name:
+        info.seekable = flac_has_seektable(path)
+    elif 'mp4' in format_name or 'mov' in format_name or 'wav' in format_name:
+        info.seekable = True  # sample tables / fixed-size PCM frames
+
+    if info.duration <= 0:
+        info.duration = decoded_duration(path)
+        info.source = 'decoded'
+
+    return info
+
+
+# --- cache -------------------------------------------------------------------
+
+_cache: Optional[OrderedDict] = None
+_cache_lock = threading.Lock()
+
+# Uploads and spool files are probed once and deleted, so they only go into
+# an in-memory cache instead of piling up dead entries on disk
+TRANSIENT_DIRS: List[str] = []
+_transient_cache: OrderedDict = OrderedDict()
+
+
+def add_transient_dir(path: str) -> None:
+    """Keep probes of files under path out of the persistent cache"""
+    TRANSIENT_DIRS.append(os.path.realpath(path))
+
+
+def is_transient(path: str) -> bool:
+    path = os.path.realpath(path)
+    return any(os.path.commonpath([d, path]) == d for d in TRANSIENT_DIRS)
+
+
+def file_key(path: str) -> str:
+    st = os.stat(path)
+    return f"{os.path.realpath(path)}|{st.st_size}|{st.st_mtime_ns}"
+
+
+def _load_cache() -> OrderedDict:
+    global _cache
+    if _cache is None:
+        try:
+            with open(CACHE_PATH) as f:
+                data = json.load(f, object_pairs_hook=OrderedDict)
+            if data.get('version') == CACHE_VERSION and isinstance(data.get('entries'), OrderedDict):
+                _cache = data['entries']
+        except (OSError, ValueError, AttributeError):
+            pass
+        if _cache is None:
+            _cache = OrderedDict()
+    return _cache
+
+
+def _remember(cache: OrderedDict, key: str, value: Dict) -> None:
+    cache[key] = value
+    cache.move_to_end(key)
+    while len(cache) > CACHE_ENTRIES:
+        cache.popitem(last=False)
+
+
+def _save_cache() -> None:
+    try:
+        os.makedirs(os.path.dirname(CACHE_PATH), exist_ok=True)
+        tmp = f"{CACHE_PATH}.{os.getpid()}.tmp"
+        with open(tmp, 'w') as f:
+            json.dump({'version': CACHE_VERSION, 'entries': _cache}, f)
+        os.replace(tmp, CACHE_PATH)
+    except OSError as e:
+        print(f"Warning: could not write probe cache: {e}")
+
+
+def probe_audio(path: str) -> Optional[AudioInfo]:
+    """Stream metadata for an audio file, cached by (path, size, mtime)
+
+    Files under TRANSIENT_DIRS are cached in memory only.
+    """
+    try:
+        key = file_key(path)
+    except OSError as e:
+        print(f"Error probing {path}: {e}")
+        return None
+
+    transient = is_transient(path)
+    with _cache_lock:
+        cache = _transient_cache if transient else _load_cache()
+        cached = cache.get(key)
+        if cached:
+            try:
+                info = AudioInfo(**cached)
+            except (TypeError, ValueError):
+                # Hand-edited or left over from an older AudioInfo: probe again
+                del cache[key]
+            else:
+                cache.move_to_end(key)
+                return info
+
+    info = None
+    try:
+        if path.lower().endswith('.mp3'):
+            info = probe_mp3(path)
+        if info is None or info.duration <= 0:
+            info = ffprobe(path)
+    except Exception as e:
+        print(f"Error probing {path}: {e}")
+        return None
+
+    if info is None or info.duration <= 0:
+        print(f"Error probing {path}: no audio stream found")
+        return None
+
+    with _cache_lock:
+        if transient:
+            _remember(_transient_cache, key, asdict(info))
+        else:
+            _remember(_load_cache(), key, asdict(info))
+            _save_cache()
+
+    return info
+
+
+def get_duration(path: str) -> int:
+    """Duration in whole seconds, 0 if it can't be determined"""
+    info = probe_audio(path)
+    return int(info.duration) if info else 0
@@ -0,0 +1,154 @@
+"""
+Profiling mode for the CLIs (--profile)
+Records a sampled wall-clock profile as collapsed stacks (flamegraph.pl /
+speedscope) and a per-segment wall-clock split between subprocesses, the
+recognizer call (signature generation plus the HTTP request) and Python.
+Nothing here is installed unless a Profiler is started.
+"""
+
+import sys
+import time
+import threading
+import subprocess
+from collections import Counter
+from typing import Dict, List, Optional
+
+
+class Profiler:
+    """Sampling profiler plus per-segment timing for one identifier"""
+
+    def __init__(self, interval: float = 0.005):
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self.segments: List[Dict] = []
+        self.current: Optional[Dict] = None
+        self.target_thread: Optional[int] = None
+        self.stopped = threading.Event()
+        self.sampler: Optional[threading.Thread] = None
+        self.restore = []
+
+    # --- instrumentation -------------------------------------------------
+
+    def _add(self, bucket: str, seconds: float) -> None:
+        if self.current is not None:
+            self.current[bucket] += seconds
+
+    def _patch(self, owner, name: str, replacement) -> None:
+        self.restore.append((owner, name, getattr(owner, name), name in vars(owner)))
+        setattr(owner, name, replacement)
+
+    def attach(self, identifier) -> None:
+        """Time segments, subprocesses and recognizer calls of an identifier"""
+        profiler = self
+
+        original_run = subprocess.run
+
+        def timed_run(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return original_run(*args, **kwargs)
+            finally:
+                profiler._add('subprocess', time.perf_counter() - started)
+
+        self._patch(subprocess, 'run', timed_run)
+
+        def timed_coroutine(original):
+            async def wrapper(*args, **kwargs):
+                started = time.perf_counter()
+                try:
+                    return await original(*args, **kwargs)
+                finally:
+                    profiler._add('recognizer', time.perf_counter() - started)
+            return wrapper
+
+        # SimpleShazam recognizes through its own coroutine, ShazamIdentifier
+        # through a shared shazamio client
+        if hasattr(identifier, 'recognize_segment_async'):
+            self._patch(identifier, 'recognize_segment_async', timed_coroutine(identifier.recognize_segment_async))
+        elif hasattr(identifier, 'shazam'):
+            self._patch(identifier.shazam, 'recognize', timed_coroutine(identifier.shazam.recognize))
+
+        original_segment = identifier.analyze_audio_segment
+
+        def timed_segment(audio_path, start_time, *args, **kwargs):
+            profiler.current = {'start': start_time, 'subprocess': 0.0, 'recognizer': 0.0}
+            started = time.perf_counter()
+            try:
+                return original_segment(audio_path, start_time, *args, **kwargs)
+            finally:
+                profiler.current['total'] = time.perf_counter() - started
+                profiler.segments.append(profiler.current)
+                profiler.current = None
+
+        self._patch(identifier, 'analyze_audio_segment', timed_segment)
+
+    # --- sampling --------------------------------------------------------
+
+    def _sample_loop(self) -> None:
+        while not self.stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.target_thread)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({code.co_filename.rsplit('/', 1)[-1]}:{code.co_firstlineno})")
+                frame = frame.f_back
+            if stack:
+                self.stacks[';'.join(reversed(stack))] += 1
+
+    def start(self) -> 'Profiler':
+        self.target_thread = threading.get_ident()
+        self.started_at = time.perf_counter()
+        self.sampler = threading.Thread(target=self._sample_loop, daemon=True)
+        self.sampler.start()
+        return self
+
+    def stop(self) -> None:
+        self.elapsed = time.perf_counter() - self.started_at
+        self.stopped.set()
+        self.sampler.join()
+        for owner, name, original, was_own in reversed(self.restore):
+            if was_own:
+                setattr(owner, name, original)
+            else:
+                delattr(owner, name)
+        self.restore = []
+
+    def __enter__(self) -> 'Profiler':
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+    # --- output ----------------------------------------------------------
+
+    def write_collapsed(self, path: str) -> None:
+        """Write collapsed stacks (`frame;frame;frame count` per line)"""
+        with open(path, 'w') as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+    def summary(self) -> str:
+        """Per-segment wall-clock table with totals"""
+        lines = [f"{'segment':>8}  {'total':>8}  {'subproc':>8}  {'recognizer':>10}  {'python':>8}"]
+        totals = {'total': 0.0, 'subprocess': 0.0, 'recognizer': 0.0, 'python': 0.0}
+
+        for seg in self.segments:
+            python = max(0.0, seg['total'] - seg['subprocess'] - seg['recognizer'])
+            totals['total'] += seg['total']
+            totals['subprocess'] += seg['subprocess']
+            totals['recognizer'] += seg['recognizer']
+            totals['python'] += python
+            start = f"{seg['start'] // 60}:{seg['start'] % 60:02d}"
+            lines.append(f"{start:>8}  {seg['total']:7.2f}s  {seg['subprocess']:7.2f}s  "
+                         f"{seg['recognizer']:9.2f}s  {python:7.2f}s")
+
+        lines.append('-' * 50)
+        lines.append(f"{'all':>8}  {totals['total']:7.2f}s  {totals['subprocess']:7.2f}s  "
+                     f"{totals['recognizer']:9.2f}s  {totals['python']:7.2f}s")
+        if totals['total']:
+            share = {k: 100 * v / totals['total'] for k, v in totals.items()}
+            lines.append(f"{'':>8}  {'':>8}  {share['subprocess']:7.1f}%  "
+                         f"{share['recognizer']:9.1f}%  {share['python']:7.1f}%")
+        lines.append(f"Wall time {self.elapsed:.2f}s, {sum(self.stacks.values())} wall-clock samples "
+                     f"(idle and waiting included) every {self.interval * 1000:.0f}ms")
+        return '\n'.join(lines)
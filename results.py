@@ -0,0 +1,230 @@
+"""
+Compact result model for recognition samples and merged tracklists
+Samples and segments live in parallel int arrays with interned track IDs,
+so long sets don't allocate a dict and a name string per sample, and the
+serializers write line by line instead of building one big string.
+"""
+
+import csv
+import json
+from array import array
+from dataclasses import dataclass
+from typing import Dict, Iterator, List, Optional, TextIO, Tuple
+
+NO_MATCH = -1
+
+
+@dataclass(frozen=True)
+class Track:
+    artist: str
+    title: str
+
+    @property
+    def name(self) -> str:
+        return f"{self.artist} - {self.title}"
+
+
+@dataclass(frozen=True)
+class Segment:
+    start: int
+    end: int
+    track: Track
+
+    @property
+    def name(self) -> str:
+        return self.track.name
+
+
+class TrackTable:
+    """Interns (artist, title) pairs to small integer IDs"""
+
+    def __init__(self):
+        self.ids: Dict[Tuple[str, str], int] = {}
+        self.tracks: List[Track] = []
+
+    def intern(self, artist: str, title: str) -> int:
+        key = (artist, title)
+        track_id = self.ids.get(key)
+        if track_id is None:
+            track_id = len(self.tracks)
+            self.ids[key] = track_id
+            self.tracks.append(Track(artist, title))
+        return track_id
+
+    def __getitem__(self, track_id: int) -> Track:
+        return self.tracks[track_id]
+
+
+class SampleSequence:
+    """Recognition results at increasing sample times, one int pair per sample"""
+
+    def __init__(self, tracks: Optional[TrackTable] = None):
+        self.tracks = tracks or TrackTable()
+        self.times = array('i')
+        self.ids = array('i')
+
+    def append(self, time_pos: int, song_info: Optional[Dict]) -> None:
+        self.times.append(time_pos)
+        if song_info:
+            self.ids.append(self.tracks.intern(song_info.get('artist', 'Unknown Artist'),
+                                               song_info.get('title', 'Unknown Title')))
+        else:
+            self.ids.append(NO_MATCH)
+
+    @classmethod
+    def from_samples(cls, samples, tracks: Optional[TrackTable] = None) -> 'SampleSequence':
+        """Build from (time, song_info) pairs already in time order"""
+        seq = cls(tracks)
+        for time_pos, song_info in samples:
+            seq.append(time_pos, song_info)
+        return seq
+
+    def __len__(self) -> int:
+        return len(self.times)
+
+    def smooth(self, max_gap: int = 1) -> 'SampleSequence':
+        """Drop blips: a run of at most max_gap samples between two samples of the
+        same track (a misfire or a missed match mid-song) is relabeled as that track"""
+        ids = array('i', self.ids)
+
+        for i, track_id in enumerate(ids):
+            if track_id == NO_MATCH:
+                continue
+            # The gap is counted in samples, matched or not
+            for j in range(i + 2, min(i + max_gap + 2, len(ids))):
+                if ids[j] == track_id:
+                    ids[i + 1:j] = array('i', [track_id]) * (j - i - 1)
+                    break
+
+        smoothed = SampleSequence(self.tracks)
+        smoothed.times = array('i', self.times)
+        smoothed.ids = ids
+        return smoothed
+
+    def merge(self, duration_seconds: int, max_gap: int = 0) -> 'SegmentList':
+        """Collapse runs of the same track into segments
+
+        A segment runs from its first sample to one second before the next
+        different track; unmatched samples never split or end a segment.
+        With max_gap > 0 the samples are smoothed first (see smooth).
+        """
+        if max_gap > 0:
+            return self.smooth(max_gap).merge(duration_seconds)
+
+        segments = SegmentList(self.tracks)
+        current = NO_MATCH
+        start = 0
+
+        for time_pos, track_id in zip(self.times, self.ids):
+            if track_id == NO_MATCH or track_id == current:
+                continue
+            if current != NO_MATCH:
+                segments.append(start, time_pos - 1, current)
+            current, start = track_id, time_pos
+
+        if current != NO_MATCH:
+            segments.append(start, duration_seconds, current)
+
+        return segments
+
+
+class SegmentList:
+    """Merged tracklist as parallel arrays of start, end and track ID"""
+
+    def __init__(self, tracks: Optional[TrackTable] = None):
+        self.tracks = tracks or TrackTable()
+        self.starts = array('i')
+        self.ends = array('i')
+        self.ids = array('i')
+
+    def append(self, start: int, end: int, track_id: int) -> None:
+        self.starts.append(start)
+        self.ends.append(end)
+        self.ids.append(track_id)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def __iter__(self) -> Iterator[Segment]:
+        tracks = self.tracks.tracks
+        for start, end, track_id in zip(self.starts, self.ends, self.ids):
+            yield Segment(start, end, tracks[track_id])
+
+    def to_dicts(self) -> List[Dict]:
+        """The {'start', 'end', 'name'} dicts the web API returns"""
+        return [{'start': seg.start, 'end': seg.end, 'name': seg.name} for seg in self]
+
+
+def format_timestamp(seconds: int) -> str:
+    """Convert seconds to M:SS format"""
+    return f"{seconds // 60}:{seconds % 60:02d}"
+
+
+def iter_segments(songs) -> Iterator[Segment]:
+    """Segments from a SegmentList or from legacy {'start', 'end', 'name'} dicts"""
+    if isinstance(songs, SegmentList):
+        yield from songs
+        return
+    for song in songs:
+        artist, _, title = song['name'].partition(' - ')
+        yield Segment(song['start'], song['end'], Track(artist, title))
+
+
+def write_text(songs, f: TextIO) -> None:
+    """YouTube-style timestamps"""
+    f.write("TIMESTAMPS:\n\n")
+    for seg in iter_segments(songs):
+        f.write(f"{format_timestamp(seg.start)} - {format_timestamp(seg.end)} - {seg.name}\n")
+
+
+def write_json(songs, f: TextIO) -> None:
+    """JSON array of {start, end, artist, title}, one element written at a time"""
+    f.write('[')
+    for i, seg in enumerate(iter_segments(songs)):
+        f.write(',\n' if i else '\n')
+        json.dump({'start': seg.start, 'end': seg.end,
+                   'artist': seg.track.artist, 'title': seg.track.title}, f)
+    f.write('\n]\n')
+
+
+def write_csv(songs, f: TextIO) -> None:
+    writer = csv.writer(f)
+    writer.writerow(['start', 'end', 'artist', 'title'])
+    for seg in iter_segments(songs):
+        writer.writerow([seg.start, seg.end, seg.track.artist, seg.track.title])
+
+
+# CUE FILE types only name a handful of containers; players treat WAVE as
+# "decode with whatever codec fits", so it is the safe label for anything else
+CUE_FILE_TYPES = {'MP3': 'MP3', 'AIFF': 'AIFF', 'AIF': 'AIFF'}
+
+
+def write_cue(songs, f: TextIO, audio_file: str = 'audio.mp3') -> None:
+    """CUE sheet; INDEX 01 is MM:SS:FF (75 frames per second)"""
+    ext = audio_file.rsplit('.', 1)[-1].upper() if '.' in audio_file else 'MP3'
+    kind = CUE_FILE_TYPES.get(ext, 'WAVE')
+    escape = lambda value: value.replace('"', "'")
+    f.write(f'FILE "{escape(audio_file)}" {kind}\n')
+    for number, seg in enumerate(iter_segments(songs), 1):
+        f.write(f"  TRACK {number:02d} AUDIO\n")
+        f.write(f'    TITLE "{escape(seg.track.title)}"\n')
+        f.write(f'    PERFORMER "{escape(seg.track.artist)}"\n')
+        f.write(f"    INDEX 01 {seg.start // 60:02d}:{seg.start % 60:02d}:00\n")
+
+
+WRITERS = {
+    'text': write_text,
+    'json': write_json,
+    'csv': write_csv,
+    'cue': write_cue,
+}
+
+EXTENSIONS = {'text': 'txt', 'json': 'json', 'csv': 'csv', 'cue': 'cue'}
+
+
+def write_tracklist(songs, f: TextIO, fmt: str = 'text', audio_file: str = 'audio.mp3') -> None:
+    """Write songs in one of the WRITERS formats"""
+    if fmt == 'cue':
+        write_cue(songs, f, audio_file)
+    else:
+        WRITERS[fmt](songs, f)
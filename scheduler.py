@@ -0,0 +1,195 @@
+"""
+Fair scheduler for segment recognition across concurrent uploads
+Interleaves segments from all active jobs over a shared pool of recognizer
+slots using weighted fair queuing, so one long set can't starve short ones.
+"""
+
+import math
+import time
+import itertools
+import threading
+from collections import deque
+from typing import Callable, Dict, List, Optional, Tuple
+
+
+SHORT_JOB_SEGMENTS = 20   # jobs with at most this many segments count as short
+SHORT_JOB_WEIGHT = 4.0    # share multiplier for short jobs
+FIRST_PASS_STRIDE = 4     # first pass covers every Nth segment of a job
+FIRST_PASS_WEIGHT = 2.0   # share multiplier while a job is still in its first pass
+STATS_WINDOW = 1000       # recent jobs kept for time-to-first-result stats
+
+
+def coverage_order(starts: List[int], stride: int = FIRST_PASS_STRIDE) -> Tuple[List[int], int]:
+    """Order segments so a coarse pass over the whole set comes first
+
+    Returns the reordered starts and how many of them belong to the first pass.
+    """
+    first_pass = starts[::stride]
+    rest = [start for i, start in enumerate(starts) if i % stride]
+    return first_pass + rest, len(first_pass)
+
+
+class ScheduledJob:
+    """One upload's segments as seen by the scheduler"""
+
+    def __init__(self, job_id: int, user: str, starts: List[int], fn: Callable[[int], Optional[Dict]]):
+        self.job_id = job_id
+        self.user = user
+        self.fn = fn
+        self.total = len(starts)
+        ordered, self.first_pass_left = coverage_order(starts)
+        self.pending = deque(ordered)
+        self.results: Dict[int, Optional[Dict]] = {}
+        self.in_flight = 0
+        self.vtime = 0.0
+        self.done = threading.Event()
+        self.submitted_at = time.monotonic()
+        self.first_result_at: Optional[float] = None
+
+        if not starts:
+            self.done.set()
+
+    @property
+    def weight(self) -> float:
+        weight = SHORT_JOB_WEIGHT if self.total <= SHORT_JOB_SEGMENTS else 1.0
+        if self.first_pass_left > 0:
+            weight *= FIRST_PASS_WEIGHT
+        return weight
+
+    def wait(self, timeout: Optional[float] = None) -> List[Tuple[int, Optional[Dict]]]:
+        """Block until every segment is done; returns (start, result) in time order"""
+        self.done.wait(timeout)
+        return sorted(self.results.items())
+
+
+class FairScheduler:
+    """Weighted fair queuing of segment recognitions across jobs and users
+
+    workers:        recognizer calls in flight at once (shared Shazam/AudD quota)
+    per_user_limit: max in-flight segments for any single user
+    min_interval:   minimum seconds between any two recognizer calls (0 = off)
+    """
+
+    def __init__(self, workers: int = 4, per_user_limit: int = 2, min_interval: float = 0.0):
+        # With no slots (or a cap of zero) _pick never finds a job and run_job blocks forever
+        if workers < 1:
+            raise ValueError(f"workers must be at least 1, got {workers}")
+        if per_user_limit < 1:
+            raise ValueError(f"per_user_limit must be at least 1, got {per_user_limit}")
+
+        self.workers = workers
+        self.per_user_limit = per_user_limit
+        self.min_interval = min_interval
+
+        self.jobs: List[ScheduledJob] = []
+        self.user_in_flight: Dict[str, int] = {}
+        self.virtual_time = 0.0
+        self.next_call_at = 0.0
+        self.ids = itertools.count(1)
+        self.cond = threading.Condition()
+        self.threads: List[threading.Thread] = []
+        self.first_result_times = deque(maxlen=STATS_WINDOW)
+
+    def submit(self, user: str, starts: List[int], fn: Callable[[int], Optional[Dict]]) -> ScheduledJob:
+        """Queue a job's segments; fn(start) is called once per segment on a pool thread"""
+        job = ScheduledJob(next(self.ids), user, list(starts), fn)
+
+        with self.cond:
+            self._start_threads()
+            if job.pending:
+                # Join at the current virtual time so new jobs get neither a backlog
+                # of credit nor a penalty relative to jobs already running
+                job.vtime = self.virtual_time
+                self.jobs.append(job)
+                self.cond.notify_all()
+
+        return job
+
+    def run_job(self, user: str, starts: List[int], fn: Callable[[int], Optional[Dict]]) -> List[Tuple[int, Optional[Dict]]]:
+        """Submit a job and wait for all of its results"""
+        return self.submit(user, starts, fn).wait()
+
+    def stats(self) -> Dict:
+        """Active jobs and time-to-first-result percentiles over recent jobs"""
+        with self.cond:
+            times = sorted(self.first_result_times)
+            active = len(self.jobs)
+
+        def pct(p: float) -> Optional[float]:
+            if not times:
+                return None
+            return round(times[min(len(times) - 1, max(0, math.ceil(p / 100 * len(times)) - 1))], 3)
+
+        return {
+            'active_jobs': active,
+            'jobs_measured': len(times),
+            'first_result_p50': pct(50),
+            'first_result_p95': pct(95),
+        }
+
+    def _start_threads(self) -> None:
+        while len(self.threads) < self.workers:
+            thread = threading.Thread(target=self._worker_loop, daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    def _pick(self) -> Optional[ScheduledJob]:
+        """Job with the smallest virtual finish time among those allowed to run"""
+        best = None
+        best_finish = 0.0
+
+        for job in self.jobs:
+            if not job.pending:
+                continue
+            if self.user_in_flight.get(job.user, 0) >= self.per_user_limit:
+                continue
+            finish = job.vtime + 1.0 / job.weight
+            if best is None or finish < best_finish:
+                best, best_finish = job, finish
+
+        return best
+
+    def _worker_loop(self) -> None:
+        while True:
+            with self.cond:
+                job = self._pick()
+                while job is None:
+                    self.cond.wait()
+                    job = self._pick()
+
+                job.vtime += 1.0 / job.weight
+                self.virtual_time = max(self.virtual_time, job.vtime - 1.0 / job.weight)
+                start = job.pending.popleft()
+                if job.first_pass_left > 0:
+                    job.first_pass_left -= 1
+                job.in_flight += 1
+                self.user_in_flight[job.user] = self.user_in_flight.get(job.user, 0) + 1
+
+                wait = 0.0
+                if self.min_interval:
+                    now = time.monotonic()
+                    wait = max(0.0, self.next_call_at - now)
+                    self.next_call_at = max(now, self.next_call_at) + self.min_interval
+
+            if wait:
+                time.sleep(wait)
+
+            try:
+                result = job.fn(start)
+            except Exception as e:
+                print(f"Error at {start}s (job {job.job_id}): {e}")
+                result = None
+
+            with self.cond:
+                job.results[start] = result
+                if job.first_result_at is None:
+                    job.first_result_at = time.monotonic()
+                    self.first_result_times.append(job.first_result_at - job.submitted_at)
+                job.in_flight -= 1
+                self.user_in_flight[job.user] -= 1
+
+                if not job.pending and job.in_flight == 0:
+                    self.jobs.remove(job)
+                    job.done.set()
+
+                self.cond.notify_all()
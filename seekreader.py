@@ -0,0 +1,429 @@
+"""
+Random-access segment reader for compressed audio
+Builds a frame/seek index once per file (MP3 frame offsets, FLAC SEEKTABLE,
+MP4 sample tables) and decodes only the frames that cover a requested window,
+so a segment at 5:00:00 costs the same as one at 0:00 and memory stays at a
+few decoded blocks no matter how long the file is.
+
+Anything without a usable index (WAV, OGG, FLAC without a seektable, non-AAC
+or malformed MP4) falls back to ffmpeg input seeking (-ss before -i), and so
+does any FLAC window whose seekpoints are too sparse to keep the read small.
+"""
+
+import os
+import mmap
+import wave
+import struct
+import threading
+import subprocess
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+
+from probe import probe_audio, iter_mp3_frames, id3v2_size
+
+
+BLOCK_SECONDS = 15     # decode granularity; windows are served from cached blocks
+CACHE_BLOCKS = 8       # decoded blocks kept per reader (~10MB at 44.1kHz mono)
+PREROLL_FRAMES = 2     # extra frames decoded before a window (bit reservoir / MDCT overlap)
+MAX_SPAN_FACTOR = 4    # a sparse FLAC seektable may read at most this many times the window's bytes
+
+
+class MP3Index:
+    """Byte offset and first sample of every MP3 frame"""
+
+    input_format = 'mp3'
+
+    def __init__(self, path: str):
+        self.path = path
+        self.offsets = array('q')
+        self.positions = array('q')  # in samples at self.sample_rate
+        self.sample_rate = 0
+
+        with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+            position = 0
+            end = 0
+            for offset, frame in iter_mp3_frames(buf, id3v2_size(buf[:10])):
+                self.sample_rate = self.sample_rate or frame.sample_rate
+                self.offsets.append(offset)
+                self.positions.append(position)
+                position += frame.samples
+                end = offset + frame.length
+
+        # Sentinel: end of the last frame
+        self.offsets.append(end)
+        self.positions.append(position)
+
+        if not self.sample_rate:
+            raise ValueError("no MP3 frames found")
+
+    def chunk(self, start: float, end: float) -> Tuple[bytes, float]:
+        """Bytes of the frames covering [start, end) and the time the first one starts at"""
+        first = max(0, bisect_right(self.positions, int(start * self.sample_rate)) - 1 - PREROLL_FRAMES)
+        last = min(len(self.offsets) - 1, bisect_left(self.positions, int(end * self.sample_rate)))
+
+        with open(self.path, 'rb') as f:
+            f.seek(self.offsets[first])
+            data = f.read(self.offsets[last] - self.offsets[first])
+
+        return data, self.positions[first] / self.sample_rate
+
+
+class FLACIndex:
+    """FLAC STREAMINFO plus SEEKTABLE points"""
+
+    input_format = 'flac'
+
+    def __init__(self, path: str):
+        self.path = path
+        self.positions = array('q')  # seekpoint sample numbers
+        self.offsets = array('q')    # absolute byte offsets of those frames
+
+        with open(path, 'rb') as f:
+            if f.read(4) != b'fLaC':
+                raise ValueError("not a FLAC file")
+
+            streaminfo = None
+            points = []
+            while True:
+                header = f.read(4)
+                if len(header) < 4:
+                    raise ValueError("truncated FLAC metadata")
+                block_type = header[0] & 0x7F
+                data = f.read(int.from_bytes(header[1:], 'big'))
+                if block_type == 0:
+                    streaminfo = data
+                elif block_type == 3:
+                    for i in range(0, len(data) - 17, 18):
+                        sample, offset, _ = struct.unpack('>QQH', data[i:i + 18])
+                        if sample != 0xFFFFFFFFFFFFFFFF:  # placeholder point
+                            points.append((sample, offset))
+                if header[0] & 0x80:
+                    break
+
+            audio_start = f.tell()
+            file_size = os.fstat(f.fileno()).st_size
+
+        if streaminfo is None or not points:
+            raise ValueError("FLAC file has no SEEKTABLE")
+
+        # 20-bit sample rate and 36-bit total samples live in bytes 10-17
+        packed = int.from_bytes(streaminfo[10:18], 'big')
+        self.sample_rate = packed >> 44
+        total_samples = packed & 0xFFFFFFFFF
+
+        # ffmpeg needs the stream header in front of the frames we hand it
+        self.header = b'fLaC' + bytes([0x80]) + len(streaminfo).to_bytes(3, 'big') + streaminfo
+
+        for sample, offset in sorted(points):
+            self.positions.append(sample)
+            self.offsets.append(audio_start + offset)
+        self.positions.append(max(total_samples, self.positions[-1]))
+        self.offsets.append(file_size)
+        # Average compressed rate, to tell when two seekpoints are too far apart
+        total_seconds = self.positions[-1] / self.sample_rate
+        self.bytes_per_second = (file_size - audio_start) / total_seconds if total_seconds else 0
+
+    def chunk(self, start: float, end: float) -> Optional[Tuple[bytes, float]]:
+        """Header plus the frames between the seekpoints around [start, end), or None
+        when the seektable is too sparse for that to stay near one window's worth"""
+        first = max(0, bisect_right(self.positions, int(start * self.sample_rate)) - 1)
+        last = min(len(self.offsets) - 1, bisect_left(self.positions, int(end * self.sample_rate)))
+        last = max(last, first + 1)
+
+        span = self.offsets[last] - self.offsets[first]
+        if self.bytes_per_second and span > MAX_SPAN_FACTOR * (end - start) * self.bytes_per_second:
+            return None
+
+        with open(self.path, 'rb') as f:
+            f.seek(self.offsets[first])
+            data = f.read(span)
+
+        return self.header + data, self.positions[first] / self.sample_rate
+
+
+class MP4Index:
+    """Per-sample offsets, sizes and timestamps of the AAC track in an MP4/M4A"""
+
+    input_format = 'aac'
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, 'rb') as f:
+            moov = self._find_moov(f)
+        if moov is None:
+            raise ValueError("no moov box")
+
+        # Positions are in the track timescale, which is what chunk() converts with
+        stbl, timescale = self._audio_stbl(moov)
+        self.sample_rate = timescale
+        self._read_esds(stbl[b'stsd'])
+
+        sizes = self._sample_sizes(stbl[b'stsz'])
+        chunk_offsets = self._chunk_offsets(stbl)
+        self.sizes = array('i', sizes)
+        self.offsets = array('q')
+        self.positions = array('q')
+
+        # stsc: runs of chunks sharing a samples-per-chunk count
+        stsc = stbl[b'stsc']
+        entries = [struct.unpack('>III', stsc[8 + 12 * i:20 + 12 * i])
+                   for i in range(struct.unpack('>I', stsc[4:8])[0])]
+        sample = 0
+        for i, (first_chunk, per_chunk, _) in enumerate(entries):
+            next_chunk = entries[i + 1][0] if i + 1 < len(entries) else len(chunk_offsets) + 1
+            for chunk in range(first_chunk, next_chunk):
+                offset = chunk_offsets[chunk - 1]
+                for _ in range(per_chunk):
+                    if sample >= len(sizes):
+                        break
+                    self.offsets.append(offset)
+                    offset += sizes[sample]
+                    sample += 1
+
+        stts = stbl[b'stts']
+        position = 0
+        for i in range(struct.unpack('>I', stts[4:8])[0]):
+            count, delta = struct.unpack('>II', stts[8 + 8 * i:16 + 8 * i])
+            for _ in range(count):
+                self.positions.append(position)
+                position += delta
+        self.positions.append(position)
+
+    @staticmethod
+    def _boxes(data: bytes, pos: int = 0, end: Optional[int] = None):
+        end = len(data) if end is None else end
+        while pos + 8 <= end:
+            size, kind = struct.unpack('>I4s', data[pos:pos + 8])
+            header = 8
+            if size == 1:
+                size = struct.unpack('>Q', data[pos + 8:pos + 16])[0]
+                header = 16
+            elif size == 0:
+                size = end - pos
+            if size < header:
+                return
+            yield kind, data[pos + header:pos + size]
+            pos += size
+
+    @staticmethod
+    def _find_moov(f) -> Optional[bytes]:
+        """Read only the moov box (mdat may be gigabytes)"""
+        while True:
+            header = f.read(8)
+            if len(header) < 8:
+                return None
+            size, kind = struct.unpack('>I4s', header)
+            header_len = 8
+            if size == 1:
+                size = struct.unpack('>Q', f.read(8))[0]
+                header_len = 16
+            if kind == b'moov':
+                return f.read(size - header_len)
+            if size == 0:
+                return None
+            f.seek(size - header_len, os.SEEK_CUR)
+
+    def _audio_stbl(self, moov: bytes):
+        for kind, trak in self._boxes(moov):
+            if kind != b'trak':
+                continue
+            mdia = dict(self._boxes(trak)).get(b'mdia')
+            if not mdia:
+                continue
+            mdia_boxes = dict(self._boxes(mdia))
+            hdlr = mdia_boxes.get(b'hdlr', b'')
+            if hdlr[8:12] != b'soun':
+                continue
+            mdhd = mdia_boxes[b'mdhd']
+            timescale = struct.unpack('>I', mdhd[20:24] if mdhd[0] == 1 else mdhd[12:16])[0]
+            minf = dict(self._boxes(mdia_boxes[b'minf']))
+            return dict(self._boxes(minf[b'stbl'])), timescale
+        raise ValueError("no audio track")
+
+    def _read_esds(self, stsd: bytes) -> None:
+        """AAC profile, sample rate index and channel config for ADTS headers"""
+        entry = next(self._boxes(stsd, 8), None)
+        if entry is None or entry[0] != b'mp4a':
+            raise ValueError("audio track is not AAC")
+        body = entry[1]
+        version = struct.unpack('>H', body[8:10])[0]
+        children = 28 + {0: 0, 1: 16, 2: 36}.get(version, 0)
+        esds = dict(self._boxes(body, children)).get(b'esds')
+        if esds is None:
+            raise ValueError("no esds box")
+
+        # Walk descriptors down to DecoderSpecificInfo (tag 5)
+        pos = 4
+        asc = None
+        while pos < len(esds):
+            tag = esds[pos]
+            pos += 1
+            length = 0
+            for _ in range(4):
+                byte = esds[pos]
+                pos += 1
+                length = (length << 7) | (byte & 0x7F)
+                if not byte & 0x80:
+                    break
+            if tag == 3:
+                flags = esds[pos + 2]
+                pos += 3
+                if flags & 0x80:  # dependsOn_ES_ID
+                    pos += 2
+                if flags & 0x40:  # URL
+                    pos += 1 + esds[pos]
+                if flags & 0x20:  # OCR_ES_Id
+                    pos += 2
+            elif tag == 4:
+                pos += 13
+            elif tag == 5:
+                asc = esds[pos:pos + length]
+                break
+            else:
+                pos += length
+
+        if not asc or len(asc) < 2:
+            raise ValueError("no AudioSpecificConfig")
+
+        bits = int.from_bytes(asc[:2], 'big')
+        object_type = bits >> 11
+        rate_index = (bits >> 7) & 0xF
+        channels = (bits >> 3) & 0xF
+        if object_type not in (1, 2, 3, 4) or rate_index == 15:
+            raise ValueError(f"unsupported AAC object type {object_type}")
+        self.profile = object_type - 1
+        self.rate_index = rate_index
+        self.channel_config = channels
+
+    @staticmethod
+    def _sample_sizes(stsz: bytes) -> List[int]:
+        constant, count = struct.unpack('>II', stsz[4:12])
+        if constant:
+            return [constant] * count
+        return list(struct.unpack(f'>{count}I', stsz[12:12 + 4 * count]))
+
+    @staticmethod
+    def _chunk_offsets(stbl) -> List[int]:
+        if b'co64' in stbl:
+            box = stbl[b'co64']
+            count = struct.unpack('>I', box[4:8])[0]
+            return list(struct.unpack(f'>{count}Q', box[8:8 + 8 * count]))
+        box = stbl[b'stco']
+        count = struct.unpack('>I', box[4:8])[0]
+        return list(struct.unpack(f'>{count}I', box[8:8 + 4 * count]))
+
+    def adts_header(self, size: int) -> bytes:
+        length = size + 7
+        return bytes([
+            0xFF, 0xF1,
+            (self.profile << 6) | (self.rate_index << 2) | (self.channel_config >> 2),
+            ((self.channel_config & 3) << 6) | (length >> 11),
+            (length >> 3) & 0xFF,
+            ((length & 7) << 5) | 0x1F,
+            0xFC
+        ])
+
+    def chunk(self, start: float, end: float) -> Tuple[bytes, float]:
+        first = max(0, bisect_right(self.positions, int(start * self.sample_rate)) - 1 - PREROLL_FRAMES)
+        last = min(len(self.sizes), bisect_left(self.positions, int(end * self.sample_rate)))
+
+        parts = []
+        with open(self.path, 'rb') as f:
+            for i in range(first, last):
+                f.seek(self.offsets[i])
+                parts.append(self.adts_header(self.sizes[i]))
+                parts.append(f.read(self.sizes[i]))
+
+        return b''.join(parts), self.positions[first] / self.sample_rate
+
+
+def build_index(path: str):
+    """Seek index for the file's container, or None to use ffmpeg input seeking"""
+    ext = path.rsplit('.', 1)[-1].lower()
+    builders = {'mp3': MP3Index, 'flac': FLACIndex, 'm4a': MP4Index, 'mp4': MP4Index}
+    builder = builders.get(ext)
+    if builder is None:
+        return None
+    try:
+        return builder(path)
+    except (ValueError, KeyError, IndexError, struct.error, OSError) as e:
+        print(f"No seek index for {os.path.basename(path)} ({e}), using ffmpeg seeking")
+        return None
+
+
+class SeekReader:
+    """Mono s16le PCM for arbitrary windows of one audio file"""
+
+    def __init__(self, path: str, sample_rate: int = 44100):
+        self.path = path
+        self.sample_rate = sample_rate
+        info = probe_audio(path)
+        self.duration = info.duration if info else 0.0
+        self.index = build_index(path)
+        self.blocks: OrderedDict = OrderedDict()
+        self.lock = threading.Lock()
+
+    def _decode(self, args: List[str], data: Optional[bytes] = None) -> bytes:
+        """Run ffmpeg to mono s16le; data, if given, is fed on stdin"""
+        cmd = ['ffmpeg', '-v', 'quiet'] + args + [
+            '-ac', '1', '-ar', str(self.sample_rate), '-f', 's16le', '-'
+        ]
+        result = subprocess.run(cmd, input=data, capture_output=True, check=True)
+        return result.stdout
+
+    def _decode_block(self, block: int) -> bytes:
+        start = block * BLOCK_SECONDS
+        end = start + BLOCK_SECONDS
+        bytes_per_second = self.sample_rate * 2
+
+        chunk = self.index.chunk(start, end) if self.index is not None else None
+        if chunk is not None:
+            data, first_time = chunk
+            pcm = self._decode(['-f', self.index.input_format, '-i', 'pipe:0'], data)
+            skip = int(round((start - first_time) * self.sample_rate)) * 2
+            pcm = pcm[skip:skip + BLOCK_SECONDS * bytes_per_second]
+        else:
+            pcm = self._decode(['-nostdin', '-ss', str(start), '-i', self.path, '-t', str(BLOCK_SECONDS)])
+
+        # Keep blocks aligned: a block is exactly BLOCK_SECONDS long except at
+        # the end of the file
+        if self.duration:
+            expected = int(min(BLOCK_SECONDS, max(0.0, self.duration - start)) * self.sample_rate) * 2
+            pcm = pcm[:expected] + bytes(max(0, expected - len(pcm)))
+        return pcm
+
+    def _block(self, block: int) -> bytes:
+        # Only the cache is locked; decodes for different blocks run in parallel
+        # (two threads missing on the same block both decode it, harmlessly)
+        with self.lock:
+            if block in self.blocks:
+                self.blocks.move_to_end(block)
+                return self.blocks[block]
+
+        pcm = self._decode_block(block)
+
+        with self.lock:
+            self.blocks[block] = pcm
+            self.blocks.move_to_end(block)
+            if len(self.blocks) > CACHE_BLOCKS:
+                self.blocks.popitem(last=False)
+        return pcm
+
+    def read(self, start: float, duration: float) -> bytes:
+        """PCM for [start, start + duration), shorter only at the end of the file"""
+        bytes_per_second = self.sample_rate * 2
+        first = int(start // BLOCK_SECONDS)
+        last = int((start + duration - 1e-9) // BLOCK_SECONDS)
+
+        pcm = b''.join(self._block(block) for block in range(first, last + 1))
+        offset = int(round((start - first * BLOCK_SECONDS) * self.sample_rate)) * 2
+        return pcm[offset:offset + int(duration * bytes_per_second)]
+
+    def write_wav(self, start: float, duration: float, out_path: str) -> None:
+        with wave.open(out_path, 'wb') as wav:
+            wav.setnchannels(1)
+            wav.setsampwidth(2)
+            wav.setframerate(self.sample_rate)
+            wav.writeframes(self.read(start, duration))
@@ -1,7 +1,10 @@
+import io
 import os
 import subprocess
 import asyncio
-from typing import List, Dict, Optional
+from typing import Dict, Optional
+from results import SampleSequence, SegmentList, format_timestamp, write_text
+from probe import get_duration
 from shazamio import Shazam
 
 
@@ -12,18 +15,8 @@ class ShazamIdentifier:
         self.shazam = Shazam()
 
     def get_audio_duration(self, audio_path: str) -> int:
-        """Get duration of audio file in seconds using ffprobe"""
-        try:
-            cmd = [
-                'ffprobe', '-i', audio_path,
-                '-show_entries', 'format=duration',
-                '-v', 'quiet', '-of', 'csv=p=0'
-            ]
-            result = subprocess.run(cmd, capture_output=True, text=True)
-            return int(float(result.stdout.strip()))
-        except Exception as e:
-            print(f"Error getting duration: {e}")
-            return 0
+        """Get duration of audio file in seconds (probed once per file, then cached)"""
+        return get_duration(audio_path)
 
     async def analyze_audio_segment_async(self, audio_path: str, start_time: int, duration: int = 10) -> Optional[Dict]:
         """Analyze a segment using Shazam"""
@@ -67,17 +60,15 @@ class ShazamIdentifier:
         """Sync wrapper for async method"""
         return asyncio.run(self.analyze_audio_segment_async(audio_path, start_time, duration))
 
-    def analyze_dj_set(self, audio_path: str, interval: int = 30) -> List[Dict]:
+    def analyze_dj_set(self, audio_path: str, interval: int = 30) -> SegmentList:
         """Analyze entire DJ set"""
         duration_seconds = self.get_audio_duration(audio_path)
 
         if duration_seconds == 0:
             print("Error: Could not determine audio duration")
-            return []
+            return SegmentList()
 
-        songs = []
-        current_song = None
-        song_start_time = 0
+        samples = SampleSequence()
 
         print(f"Analyzing {duration_seconds} seconds of audio...")
 
@@ -86,45 +77,16 @@ class ShazamIdentifier:
 
             song_info = self.analyze_audio_segment(audio_path, time_pos)
 
-            if song_info:
-                song_name = f"{song_info.get('artist', 'Unknown Artist')} - {song_info.get('title', 'Unknown Title')}"
-
-                # New song detected
-                if current_song != song_name:
-                    # Save previous song if exists
-                    if current_song:
-                        songs.append({
-                            'start': song_start_time,
-                            'end': time_pos - 1,
-                            'name': current_song
-                        })
+            samples.append(time_pos, song_info)
 
-                    current_song = song_name
-                    song_start_time = time_pos
-
-        # Add the last song
-        if current_song:
-            songs.append({
-                'start': song_start_time,
-                'end': duration_seconds,
-                'name': current_song
-            })
-
-        return songs
+        return samples.merge(duration_seconds)
 
     def format_timestamp(self, seconds: int) -> str:
         """Convert seconds to M:SS format"""
-        minutes = seconds // 60
-        secs = seconds % 60
-        return f"{minutes}:{secs:02d}"
+        return format_timestamp(seconds)
 
-    def format_tracklist(self, songs: List[Dict]) -> str:
+    def format_tracklist(self, songs) -> str:
         """Format song list as YouTube-style timestamps"""
-        output = "TIMESTAMPS:\n\n"
-
-        for song in songs:
-            start = self.format_timestamp(song['start'])
-            end = self.format_timestamp(song['end'])
-            output += f"{start} - {end} - {song['name']}\n"
-
-        return output
+        output = io.StringIO()
+        write_text(songs, output)
+        return output.getvalue()
@@ -2,26 +2,33 @@ import os
 import subprocess
 import asyncio
 import json
-from typing import List, Dict, Optional
+import uuid
+import io
+from typing import List, Dict, Optional, Tuple
 from pathlib import Path
+from results import SampleSequence, SegmentList, format_timestamp, write_text
+from probe import get_duration
+from seekreader import SeekReader
 
 
 class SimpleShazam:
     """Shazam identifier that bypasses pydub issues"""
 
+    def __init__(self, random_access: Optional[bool] = None, smooth_gap: Optional[int] = None):
+        # Random access decodes only the frames around each segment instead of
+        # having ffmpeg decode from the start of the file every time
+        if random_access is None:
+            random_access = os.getenv('TRANSCRIPT_RANDOM_ACCESS', '') not in ('', '0')
+        self.random_access = random_access
+        # Relabel runs of up to smooth_gap misfired/missed samples inside a track
+        if smooth_gap is None:
+            smooth_gap = int(os.getenv('TRANSCRIPT_SMOOTH_GAP', 0))
+        self.smooth_gap = smooth_gap
+        self.reader: Optional[SeekReader] = None
+
     def get_audio_duration(self, audio_path: str) -> int:
-        """Get duration of audio file in seconds"""
-        try:
-            cmd = [
-                'ffprobe', '-i', audio_path,
-                '-show_entries', 'format=duration',
-                '-v', 'quiet', '-of', 'csv=p=0'
-            ]
-            result = subprocess.run(cmd, capture_output=True, text=True)
-            return int(float(result.stdout.strip()))
-        except Exception as e:
-            print(f"Error getting duration: {e}")
-            return 0
+        """Get duration of audio file in seconds (probed once per file, then cached)"""
+        return get_duration(audio_path)
 
     async def recognize_segment_async(self, segment_path: str) -> Optional[Dict]:
         """Use ShazamIO to recognize a segment"""
@@ -45,7 +52,11 @@ class SimpleShazam:
 
     def analyze_audio_segment(self, audio_path: str, start_time: int, duration: int = 12) -> Optional[Dict]:
         """Extract segment and recognize with Shazam"""
-        temp_file = f"temp_shazam_{start_time}.mp3"
+        if self.random_access:
+            return self.analyze_audio_segment_indexed(audio_path, start_time, duration)
+
+        # Unique per call: segments from concurrent jobs may share a start time
+        temp_file = f"temp_shazam_{uuid.uuid4().hex}_{start_time}.mp3"
 
         try:
             # Extract segment
@@ -78,17 +89,50 @@ class SimpleShazam:
                 os.remove(temp_file)
             return None
 
-    def analyze_dj_set(self, audio_path: str, interval: int = 45) -> List[Dict]:
-        """Analyze DJ set with Shazam"""
+    def analyze_audio_segment_indexed(self, audio_path: str, start_time: int, duration: int = 12) -> Optional[Dict]:
+        """Cut the segment through a SeekReader (one seek index per file) and recognize it"""
+        temp_file = f"temp_shazam_{uuid.uuid4().hex}_{start_time}.wav"
+
+        try:
+            reader = self.reader
+            if reader is None or reader.path != audio_path:
+                # Called outside analyze_dj_set: a one-off reader for this segment
+                reader = SeekReader(audio_path)
+            reader.write_wav(start_time, duration, temp_file)
+            return asyncio.run(self.recognize_segment_async(temp_file))
+
+        except Exception as e:
+            print(f"Error at {start_time}s: {e}")
+            return None
+
+        finally:
+            if os.path.exists(temp_file):
+                os.remove(temp_file)
+
+    def analyze_dj_set(self, audio_path: str, interval: int = 45, scheduler=None, user: str = 'local') -> SegmentList:
+        """Analyze DJ set with Shazam
+
+        With a FairScheduler, segments are recognized on its shared pool,
+        interleaved with other users' jobs, instead of one by one here.
+        """
         duration_seconds = self.get_audio_duration(audio_path)
 
         if duration_seconds == 0:
             print("Error: Could not determine audio duration")
-            return []
+            return SegmentList()
+
+        if self.random_access:
+            # One seek index and block cache for every segment, built before
+            # the scheduler's pool threads start asking for segments
+            self.reader = SeekReader(audio_path)
 
-        songs = []
-        current_song = None
-        song_start_time = 0
+        if scheduler is not None:
+            starts = list(range(0, duration_seconds, interval))
+            print(f"🎵 Scheduling {len(starts)} segments for {user}...")
+            samples = scheduler.run_job(user, starts, lambda start: self.analyze_audio_segment(audio_path, start))
+            return self.merge_samples(samples, duration_seconds)
+
+        samples = SampleSequence()
 
         print(f"🎵 Analyzing {duration_seconds // 60} minutes of audio with Shazam...")
         print(f"Checking every {interval} seconds\n")
@@ -101,48 +145,27 @@ class SimpleShazam:
             song_info = self.analyze_audio_segment(audio_path, time_pos)
 
             if song_info:
-                song_name = f"{song_info['artist']} - {song_info['title']}"
-                print(f"✅ {song_name}")
-
-                # New song detected
-                if current_song != song_name:
-                    # Save previous song
-                    if current_song:
-                        songs.append({
-                            'start': song_start_time,
-                            'end': time_pos - 1,
-                            'name': current_song
-                        })
-
-                    current_song = song_name
-                    song_start_time = time_pos
+                print(f"✅ {song_info['artist']} - {song_info['title']}")
             else:
                 print("❌ Not found")
 
-        # Add the last song
-        if current_song:
-            songs.append({
-                'start': song_start_time,
-                'end': duration_seconds,
-                'name': current_song
-            })
+            samples.append(time_pos, song_info)
+
+        return samples.merge(duration_seconds, self.smooth_gap)
 
-        return songs
+    def merge_samples(self, samples: List[Tuple[int, Optional[Dict]]], duration_seconds: int) -> SegmentList:
+        """Collapse (time, song_info) samples, in time order, into song ranges"""
+        return SampleSequence.from_samples(samples).merge(duration_seconds, self.smooth_gap)
 
     def format_timestamp(self, seconds: int) -> str:
         """Convert seconds to M:SS format"""
-        minutes = seconds // 60
-        secs = seconds % 60
-        return f"{minutes}:{secs:02d}"
+        return format_timestamp(seconds)
 
-    def format_tracklist(self, songs: List[Dict]) -> str:
+    def format_tracklist(self, songs) -> str:
         """Format as YouTube timestamps"""
         if not songs:
             return "TIMESTAMPS:\n\n(No songs identified - tracks may not be in Shazam's database)"
 
-        output = "TIMESTAMPS:\n\n"
-        for song in songs:
-            start = self.format_timestamp(song['start'])
-            end = self.format_timestamp(song['end'])
-            output += f"{start} - {end} - {song['name']}\n"
-        return output
+        output = io.StringIO()
+        write_text(songs, output)
+        return output.getvalue()
@@ -1,7 +1,10 @@
+import io
 import os
 import requests
 import subprocess
-from typing import List, Dict, Optional
+from typing import Dict, Optional
+from results import SampleSequence, SegmentList, format_timestamp, write_text
+from probe import get_duration
 import time
 
 
@@ -13,18 +16,8 @@ class SongIdentifier:
         self.base_url = "https://api.audd.io/"
 
     def get_audio_duration(self, audio_path: str) -> int:
-        """Get duration of audio file in seconds using ffprobe"""
-        try:
-            cmd = [
-                'ffprobe', '-i', audio_path,
-                '-show_entries', 'format=duration',
-                '-v', 'quiet', '-of', 'csv=p=0'
-            ]
-            result = subprocess.run(cmd, capture_output=True, text=True)
-            return int(float(result.stdout.strip()))
-        except Exception as e:
-            print(f"Error getting duration: {e}")
-            return 0
+        """Get duration of audio file in seconds (probed once per file, then cached)"""
+        return get_duration(audio_path)
 
     def analyze_audio_segment(self, audio_path: str, start_time: int, duration: int = 10) -> Optional[Dict]:
         """
@@ -75,7 +68,7 @@ class SongIdentifier:
                 os.remove(temp_file)
             return None
 
-    def analyze_dj_set(self, audio_path: str, interval: int = 30) -> List[Dict]:
+    def analyze_dj_set(self, audio_path: str, interval: int = 30) -> SegmentList:
         """
         Analyze entire DJ set by sampling at intervals
 
@@ -84,17 +77,15 @@ class SongIdentifier:
             interval: Seconds between samples (default 30)
 
         Returns:
-            List of identified songs with timestamps
+            SegmentList of identified songs with timestamps
         """
         duration_seconds = self.get_audio_duration(audio_path)
 
         if duration_seconds == 0:
             print("Error: Could not determine audio duration")
-            return []
+            return SegmentList()
 
-        songs = []
-        current_song = None
-        song_start_time = 0
+        samples = SampleSequence()
 
         print(f"Analyzing {duration_seconds} seconds of audio...")
 
@@ -103,51 +94,22 @@ class SongIdentifier:
 
             song_info = self.analyze_audio_segment(audio_path, time_pos)
 
-            if song_info:
-                song_name = f"{song_info.get('artist', 'Unknown Artist')} - {song_info.get('title', 'Unknown Title')}"
-
-                # New song detected
-                if current_song != song_name:
-                    # Save previous song if exists
-                    if current_song:
-                        songs.append({
-                            'start': song_start_time,
-                            'end': time_pos - 1,
-                            'name': current_song
-                        })
-
-                    current_song = song_name
-                    song_start_time = time_pos
+            samples.append(time_pos, song_info)
 
             # Rate limiting - AudD free tier allows 1 request per second
             time.sleep(1)
 
-        # Add the last song
-        if current_song:
-            songs.append({
-                'start': song_start_time,
-                'end': duration_seconds,
-                'name': current_song
-            })
-
-        return songs
+        return samples.merge(duration_seconds)
 
     def format_timestamp(self, seconds: int) -> str:
         """Convert seconds to M:SS format"""
-        minutes = seconds // 60
-        secs = seconds % 60
-        return f"{minutes}:{secs:02d}"
+        return format_timestamp(seconds)
 
-    def format_tracklist(self, songs: List[Dict]) -> str:
+    def format_tracklist(self, songs) -> str:
         """Format song list as YouTube-style timestamps"""
-        output = "TIMESTAMPS:\n\n"
-
-        for song in songs:
-            start = self.format_timestamp(song['start'])
-            end = self.format_timestamp(song['end'])
-            output += f"{start} - {end} - {song['name']}\n"
-
-        return output
+        output = io.StringIO()
+        write_text(songs, output)
+        return output.getvalue()
 
 
 # Alternative: ACRCloud implementation (more accurate but requires more setup)
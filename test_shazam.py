@@ -2,15 +2,28 @@
 import sys
 import os
 from shazam_simple import SimpleShazam
+from profiler import Profiler
+from results import WRITERS, EXTENSIONS, write_tracklist
 
 
 def main():
-    if len(sys.argv) < 2:
-        print("Usage: python test_shazam.py <audio_file> [interval_seconds]")
+    options = [arg for arg in sys.argv[1:] if arg.startswith('--')]
+    args = [arg for arg in sys.argv[1:] if not arg.startswith('--')]
+    profile = '--profile' in options
+    output_format = next((opt.split('=', 1)[1] for opt in options if opt.startswith('--format=')), 'text')
+    smooth = next((opt for opt in options if opt == '--smooth' or opt.startswith('--smooth=')), None)
+    smooth_gap = int(smooth.split('=', 1)[1]) if smooth and '=' in smooth else (1 if smooth else None)
+
+    if output_format not in WRITERS:
+        print(f"Error: Unknown format {output_format} (choose from: {', '.join(WRITERS)})")
+        sys.exit(1)
+
+    if len(args) < 1:
+        print("Usage: python test_shazam.py <audio_file> [interval_seconds] [--profile] [--random-access] [--smooth[=N]] [--format=text|json|csv|cue]")
         sys.exit(1)
 
-    audio_path = sys.argv[1]
-    interval = int(sys.argv[2]) if len(sys.argv) > 2 else 45
+    audio_path = args[0]
+    interval = int(args[1]) if len(args) > 1 else 45
 
     if not os.path.exists(audio_path):
         print(f"❌ File not found: {audio_path}")
@@ -21,18 +34,33 @@ def main():
     print(f"⏱️  Interval: {interval}s\n")
     print("="*60 + "\n")
 
-    shazam = SimpleShazam()
+    shazam = SimpleShazam(random_access=True if '--random-access' in options else None, smooth_gap=smooth_gap)
+    profiler = None
+    if profile:
+        profiler = Profiler()
+        profiler.attach(shazam)
+        profiler.start()
+
     songs = shazam.analyze_dj_set(audio_path, interval=interval)
 
+    if profiler:
+        profiler.stop()
+
     print("\n" + "="*60)
     tracklist = shazam.format_tracklist(songs)
     print(tracklist)
     print("="*60)
 
+    if profiler:
+        profile_file = audio_path.rsplit('.', 1)[0] + '_profile.folded'
+        profiler.write_collapsed(profile_file)
+        print("\n" + profiler.summary())
+        print(f"🔥 Profile saved to: {profile_file} (open in speedscope.app or flamegraph.pl)")
+
     if songs:
-        output_file = audio_path.rsplit('.', 1)[0] + '_tracklist.txt'
-        with open(output_file, 'w') as f:
-            f.write(tracklist)
+        output_file = audio_path.rsplit('.', 1)[0] + '_tracklist.' + EXTENSIONS[output_format]
+        with open(output_file, 'w', newline='') as f:
+            write_tracklist(songs, f, output_format, os.path.basename(audio_path))
         print(f"\n✅ Saved to: {output_file}")
     else:
         print("\n⚠️  No songs found. Your tracks may be:")
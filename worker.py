@@ -0,0 +1,530 @@
+#!/usr/bin/env python3
+"""
+Distributed worker mode for analyzing DJ sets
+Jobs are split into decode -> plan -> recognize -> merge tasks on a broker
+and processed by any number of worker processes/nodes.
+
+Usage:
+    python worker.py work                      # run a worker (repeat for more)
+    python worker.py submit path/to/djset.mp3 [interval_seconds]
+    python worker.py status <job_id>
+
+The broker is picked from TRANSCRIPT_BROKER:
+    sqlite:///jobs.db          (default, local testing / single host)
+    redis://localhost:6379/0   (needs `pip install redis`)
+Audio paths must be readable by every worker (shared TRANSCRIPT_SPOOL dir).
+"""
+
+import os
+import sys
+import json
+import time
+import uuid
+import wave
+import socket
+import asyncio
+import sqlite3
+import subprocess
+from typing import List, Dict, Optional
+from shazam_simple import SimpleShazam
+
+
+DEFAULT_BROKER = 'sqlite:///jobs.db'
+SPOOL_DIR = os.getenv('TRANSCRIPT_SPOOL', 'spool')
+SEGMENT_SECONDS = 12   # same window SimpleShazam uses
+LEASE_SECONDS = 300    # a task is handed out again if not acked in time
+
+# Per-stage leases: decoding a long set can take far longer than recognizing
+# one segment, and a lease that runs out mid-task hands the task to a second worker
+MAX_ATTEMPTS = 3       # a failing task is retried this many times before the job fails
+
+STAGE_LEASES = {
+    'decode': int(os.getenv('TRANSCRIPT_DECODE_LEASE', 3600)),
+    'plan': 120,
+    'recognize': LEASE_SECONDS,
+    'merge': 120,
+}
+
+
+class SQLiteBroker:
+    """Job/task broker backed by a single SQLite file (local stand-in for Redis)"""
+
+    def __init__(self, path: str):
+        self.conn = sqlite3.connect(path, timeout=30, isolation_level=None)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.executescript('''
+            CREATE TABLE IF NOT EXISTS jobs (id TEXT PRIMARY KEY, data TEXT NOT NULL);
+            CREATE TABLE IF NOT EXISTS tasks (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                payload TEXT NOT NULL,
+                lease_until REAL NOT NULL DEFAULT 0,
+                done INTEGER NOT NULL DEFAULT 0
+            );
+            CREATE TABLE IF NOT EXISTS results (
+                job_id TEXT NOT NULL,
+                start INTEGER NOT NULL,
+                data TEXT,
+                PRIMARY KEY (job_id, start)
+            );
+        ''')
+
+    def create_job(self, job: Dict) -> None:
+        self.conn.execute('INSERT INTO jobs (id, data) VALUES (?, ?)', (job['id'], json.dumps(job)))
+
+    def get_job(self, job_id: str) -> Optional[Dict]:
+        row = self.conn.execute('SELECT data FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def update_job(self, job_id: str, **fields) -> None:
+        self.conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = self.conn.execute('SELECT data FROM jobs WHERE id = ?', (job_id,)).fetchone()
+            job = json.loads(row[0])
+            job.update(fields)
+            self.conn.execute('UPDATE jobs SET data = ? WHERE id = ?', (json.dumps(job), job_id))
+            self.conn.execute('COMMIT')
+        except Exception:
+            self.conn.execute('ROLLBACK')
+            raise
+
+    def transition_job(self, job_id: str, from_states, to_state: str, **fields) -> bool:
+        """Move a job to to_state only if it is in one of from_states; returns False otherwise"""
+        self.conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = self.conn.execute('SELECT data FROM jobs WHERE id = ?', (job_id,)).fetchone()
+            job = json.loads(row[0])
+            if job.get('state') not in from_states:
+                self.conn.execute('ROLLBACK')
+                return False
+            job.update(fields, state=to_state)
+            self.conn.execute('UPDATE jobs SET data = ? WHERE id = ?', (json.dumps(job), job_id))
+            self.conn.execute('COMMIT')
+            return True
+        except Exception:
+            self.conn.execute('ROLLBACK')
+            raise
+
+    def enqueue(self, tasks: List[Dict]) -> None:
+        self.conn.execute('BEGIN IMMEDIATE')
+        self.conn.executemany('INSERT INTO tasks (payload) VALUES (?)',
+                              [(json.dumps(task),) for task in tasks])
+        self.conn.execute('COMMIT')
+
+    def claim(self, leases: Dict[str, int] = STAGE_LEASES) -> Optional[Dict]:
+        now = time.time()
+        self.conn.execute('BEGIN IMMEDIATE')
+        row = self.conn.execute(
+            'SELECT id, payload FROM tasks WHERE done = 0 AND lease_until < ? ORDER BY id LIMIT 1',
+            (now,)
+        ).fetchone()
+        if row:
+            task = json.loads(row[1])
+            lease = leases.get(task['stage'], LEASE_SECONDS)
+            self.conn.execute('UPDATE tasks SET lease_until = ? WHERE id = ?', (now + lease, row[0]))
+        self.conn.execute('COMMIT')
+
+        if not row:
+            return None
+        task['_id'] = row[0]
+        return task
+
+    def ack(self, task: Dict) -> None:
+        self.conn.execute('UPDATE tasks SET done = 1 WHERE id = ?', (task['_id'],))
+
+    def put_result(self, job_id: str, start: int, song_info: Optional[Dict]) -> bool:
+        """Store a segment result; returns False if it was already recorded"""
+        cur = self.conn.execute(
+            'INSERT OR IGNORE INTO results (job_id, start, data) VALUES (?, ?, ?)',
+            (job_id, start, json.dumps(song_info))
+        )
+        return cur.rowcount == 1
+
+    def count_results(self, job_id: str) -> int:
+        return self.conn.execute('SELECT COUNT(*) FROM results WHERE job_id = ?', (job_id,)).fetchone()[0]
+
+    def get_results(self, job_id: str) -> Dict[int, Optional[Dict]]:
+        rows = self.conn.execute('SELECT start, data FROM results WHERE job_id = ?', (job_id,))
+        return {start: json.loads(data) for start, data in rows}
+
+
+# Redis keeps each claimed task's payload in 'processing', a lease deadline
+# per claim token in 'leases' and token -> payload in 'claims'. Every move
+# between them is one script, and a claim is only released by its own token,
+# so a slow worker acking after its lease expired can't touch the new claim.
+CLAIM_SCRIPT = """
+local payload = redis.call('RPOPLPUSH', KEYS[1], KEYS[2])
+if payload then
+    local lease = cjson.decode(ARGV[3])[cjson.decode(payload)['stage']] or tonumber(ARGV[4])
+    redis.call('ZADD', KEYS[3], tonumber(ARGV[2]) + lease, ARGV[1])
+    redis.call('HSET', KEYS[4], ARGV[1], payload)
+end
+return payload
+"""
+
+REQUEUE_SCRIPT = """
+for _, token in ipairs(redis.call('ZRANGEBYSCORE', KEYS[3], 0, ARGV[1])) do
+    redis.call('ZREM', KEYS[3], token)
+    local payload = redis.call('HGET', KEYS[4], token)
+    redis.call('HDEL', KEYS[4], token)
+    if payload then
+        redis.call('LREM', KEYS[2], 1, payload)
+        redis.call('RPUSH', KEYS[1], payload)
+    end
+end
+"""
+
+ACK_SCRIPT = """
+if redis.call('ZREM', KEYS[3], ARGV[1]) == 0 then
+    return 0
+end
+local payload = redis.call('HGET', KEYS[4], ARGV[1])
+redis.call('HDEL', KEYS[4], ARGV[1])
+if payload then
+    redis.call('LREM', KEYS[2], 1, payload)
+end
+return 1
+"""
+
+
+class RedisBroker:
+    """Job/task broker backed by Redis (reliable queue with leases)"""
+
+    def __init__(self, url: str, prefix: str = 'transcriptsongs'):
+        # Import here so the SQLite broker works without redis installed
+        import redis
+
+        self.r = redis.Redis.from_url(url, decode_responses=True)
+        self.prefix = prefix
+        self._claim_script = self.r.register_script(CLAIM_SCRIPT)
+        self._requeue_script = self.r.register_script(REQUEUE_SCRIPT)
+        self._ack_script = self.r.register_script(ACK_SCRIPT)
+
+    def _key(self, *parts) -> str:
+        return ':'.join((self.prefix,) + tuple(str(p) for p in parts))
+
+    def create_job(self, job: Dict) -> None:
+        self.r.set(self._key('job', job['id']), json.dumps(job))
+
+    def get_job(self, job_id: str) -> Optional[Dict]:
+        data = self.r.get(self._key('job', job_id))
+        return json.loads(data) if data else None
+
+    def update_job(self, job_id: str, **fields) -> None:
+        from redis.exceptions import WatchError
+
+        key = self._key('job', job_id)
+        with self.r.pipeline() as pipe:
+            while True:
+                try:
+                    pipe.watch(key)
+                    job = json.loads(pipe.get(key))
+                    job.update(fields)
+                    pipe.multi()
+                    pipe.set(key, json.dumps(job))
+                    pipe.execute()
+                    return
+                except WatchError:
+                    continue
+
+    def transition_job(self, job_id: str, from_states, to_state: str, **fields) -> bool:
+        """Move a job to to_state only if it is in one of from_states; returns False otherwise"""
+        from redis.exceptions import WatchError
+
+        key = self._key('job', job_id)
+        with self.r.pipeline() as pipe:
+            while True:
+                try:
+                    pipe.watch(key)
+                    job = json.loads(pipe.get(key))
+                    if job.get('state') not in from_states:
+                        pipe.unwatch()
+                        return False
+                    job.update(fields, state=to_state)
+                    pipe.multi()
+                    pipe.set(key, json.dumps(job))
+                    pipe.execute()
+                    return True
+                except WatchError:
+                    continue
+
+    def enqueue(self, tasks: List[Dict]) -> None:
+        payloads = [json.dumps(dict(task, _id=uuid.uuid4().hex)) for task in tasks]
+        self.r.lpush(self._key('queue'), *payloads)
+
+    def _queue_keys(self) -> List[str]:
+        return [self._key('queue'), self._key('processing'), self._key('leases'), self._key('claims')]
+
+    def _requeue_expired(self) -> None:
+        self._requeue_script(keys=self._queue_keys(), args=[time.time()])
+
+    def claim(self, leases: Dict[str, int] = STAGE_LEASES) -> Optional[Dict]:
+        self._requeue_expired()
+        token = uuid.uuid4().hex
+        payload = self._claim_script(
+            keys=self._queue_keys(),
+            args=[token, time.time(), json.dumps(leases), LEASE_SECONDS]
+        )
+        if payload is None:
+            return None
+        task = json.loads(payload)
+        task['_claim'] = token
+        return task
+
+    def ack(self, task: Dict) -> None:
+        # A no-op if the lease already expired and the task was requeued
+        self._ack_script(keys=self._queue_keys(), args=[task['_claim']])
+
+    def put_result(self, job_id: str, start: int, song_info: Optional[Dict]) -> bool:
+        """Store a segment result; returns False if it was already recorded"""
+        return bool(self.r.hsetnx(self._key('results', job_id), start, json.dumps(song_info)))
+
+    def count_results(self, job_id: str) -> int:
+        return self.r.hlen(self._key('results', job_id))
+
+    def get_results(self, job_id: str) -> Dict[int, Optional[Dict]]:
+        data = self.r.hgetall(self._key('results', job_id))
+        return {int(start): json.loads(value) for start, value in data.items()}
+
+
+def get_broker(url: Optional[str] = None):
+    """Build a broker from a sqlite:/// or redis:// URL (default: TRANSCRIPT_BROKER)"""
+    url = url or os.getenv('TRANSCRIPT_BROKER', DEFAULT_BROKER)
+    if url.startswith('sqlite:///'):
+        return SQLiteBroker(url[len('sqlite:///'):])
+    if url.startswith(('redis://', 'rediss://', 'unix://')):
+        return RedisBroker(url)
+    raise ValueError(f"Unsupported broker URL: {url}")
+
+
+def submit_job(broker, audio_path: str, interval: int = 45) -> str:
+    """Create a job for an audio file and queue its decode task"""
+    job_id = uuid.uuid4().hex
+    broker.create_job({
+        'id': job_id,
+        'audio_path': os.path.abspath(audio_path),
+        'interval': interval,
+        'state': 'queued',
+        'submitted_at': time.time()
+    })
+    broker.enqueue([{'job_id': job_id, 'stage': 'decode'}])
+    return job_id
+
+
+class Worker:
+    """Pulls tasks from a broker and runs the matching pipeline stage"""
+
+    def __init__(self, broker, spool_dir: str = SPOOL_DIR):
+        self.broker = broker
+        self.spool_dir = spool_dir
+        self.worker_id = f"{socket.gethostname()}-{os.getpid()}"
+        self.identifier = SimpleShazam()
+        os.makedirs(self.spool_dir, exist_ok=True)
+
+    def decoded_path(self, job_id: str) -> str:
+        return os.path.join(self.spool_dir, f"{job_id}.wav")
+
+    def decode(self, job: Dict) -> None:
+        """Decode the upload once to mono 44.1kHz WAV on the shared spool
+
+        A task redelivered after its lease ran out finds the job still
+        'decoding' and redoes the work; anything further along is skipped.
+        The WAV is written under a per-worker name and renamed into place,
+        so a reader never sees a half-written file.
+        """
+        if not self.broker.transition_job(job['id'], ('queued', 'decoding'), 'decoding'):
+            return
+
+        partial = f"{self.decoded_path(job['id'])}.{self.worker_id}.part"
+        cmd = [
+            'ffmpeg', '-i', job['audio_path'],
+            '-ac', '1',
+            '-ar', '44100',
+            '-acodec', 'pcm_s16le',
+            '-f', 'wav',
+            '-y',
+            partial
+        ]
+        try:
+            subprocess.run(cmd, capture_output=True, check=True)
+            os.replace(partial, self.decoded_path(job['id']))
+        finally:
+            if os.path.exists(partial):
+                os.remove(partial)
+
+        # Only one of two racing decoders gets to queue the plan
+        if self.broker.transition_job(job['id'], ('decoding',), 'decoded'):
+            self.broker.enqueue([{'job_id': job['id'], 'stage': 'plan'}])
+
+    def plan(self, job: Dict) -> None:
+        """Read the exact duration from the decoded WAV and queue one task per segment"""
+        if job['state'] not in ('decoded', 'planning'):
+            return
+
+        with wave.open(self.decoded_path(job['id'])) as wav:
+            duration_seconds = wav.getnframes() // wav.getframerate()
+
+        if duration_seconds == 0:
+            raise ValueError("Could not determine audio duration")
+
+        # A redelivered plan ('planning') queues the segments again; put_result
+        # and the merge state check already make duplicate recognize tasks harmless
+        starts = list(range(0, duration_seconds, job['interval']))
+        if not self.broker.transition_job(job['id'], ('decoded', 'planning'), 'planning',
+                                          duration=duration_seconds, segments=len(starts)):
+            return
+        self.broker.enqueue([{'job_id': job['id'], 'stage': 'recognize', 'start': start} for start in starts])
+        self.broker.transition_job(job['id'], ('planning',), 'running')
+
+    def recognize(self, job: Dict, start: int) -> None:
+        """Cut a segment straight out of the decoded WAV and recognize it"""
+        temp_file = os.path.join(self.spool_dir, f"temp_{job['id']}_{start}_{self.worker_id}.wav")
+
+        try:
+            with wave.open(self.decoded_path(job['id'])) as src:
+                rate = src.getframerate()
+                src.setpos(min(start * rate, src.getnframes()))
+                frames = src.readframes(SEGMENT_SECONDS * rate)
+                with wave.open(temp_file, 'wb') as dst:
+                    dst.setparams(src.getparams())
+                    dst.writeframes(frames)
+
+            song_info = asyncio.run(self.identifier.recognize_segment_async(temp_file))
+        finally:
+            if os.path.exists(temp_file):
+                os.remove(temp_file)
+
+        self.broker.put_result(job['id'], start, song_info)
+
+        # Any worker that sees every result queues a merge; merge() lets only one
+        # of them do the work, and a worker dying here just leaves it to the next
+        if self.broker.count_results(job['id']) >= job['segments']:
+            self.broker.enqueue([{'job_id': job['id'], 'stage': 'merge'}])
+
+    def merge(self, job: Dict) -> None:
+        """Reassemble segment results into the final tracklist
+
+        Duplicate merge tasks are expected; the state transitions let one of
+        them finish the job and turn the rest into no-ops. 'planning' is
+        accepted because the last segment can finish before plan marks the
+        job 'running'.
+        """
+        if not self.broker.transition_job(job['id'], ('planning', 'running', 'merging'), 'merging'):
+            return
+
+        results = self.broker.get_results(job['id'])
+        samples = sorted(results.items())
+        songs = self.identifier.merge_samples(samples, job['duration'])
+
+        if self.broker.transition_job(
+            job['id'], ('merging',), 'done',
+            songs=songs.to_dicts(),
+            tracklist=self.identifier.format_tracklist(songs),
+            finished_at=time.time()
+        ):
+            self.cleanup(job)
+
+    def cleanup(self, job: Dict) -> None:
+        """Remove the decoded WAV, and the upload if it was spooled for this job"""
+        paths = [self.decoded_path(job['id'])]
+        # Files submitted from the CLI live outside the spool and belong to the user
+        spool = os.path.abspath(self.spool_dir)
+        if os.path.commonpath([spool, os.path.abspath(job['audio_path'])]) == spool:
+            paths.append(job['audio_path'])
+
+        for path in paths:
+            if os.path.exists(path):
+                os.remove(path)
+
+    def fail(self, task: Dict, error: Exception) -> None:
+        """Requeue a failed task, or fail its job once MAX_ATTEMPTS is used up"""
+        attempts = task.get('attempts', 0) + 1
+        if attempts < MAX_ATTEMPTS:
+            print(f"Error in {task['stage']} for job {task['job_id']} "
+                  f"(attempt {attempts}/{MAX_ATTEMPTS}, retrying): {error}")
+            retry = {key: value for key, value in task.items() if not key.startswith('_')}
+            retry['attempts'] = attempts
+            self.broker.enqueue([retry])
+            return
+
+        print(f"Error in {task['stage']} for job {task['job_id']}: {error}")
+        self.broker.update_job(task['job_id'], state='failed', error=str(error))
+        job = self.broker.get_job(task['job_id'])
+        if job is not None:
+            self.cleanup(job)
+
+    def run_task(self, task: Dict) -> None:
+        job = self.broker.get_job(task['job_id'])
+        if job is None or job.get('state') in ('done', 'failed'):
+            return
+
+        stage = task['stage']
+        if stage == 'decode':
+            self.decode(job)
+        elif stage == 'plan':
+            self.plan(job)
+        elif stage == 'recognize':
+            self.recognize(job, task['start'])
+        elif stage == 'merge':
+            self.merge(job)
+        else:
+            raise ValueError(f"Unknown stage: {stage}")
+
+    def run(self, poll_interval: float = 1.0, once: bool = False) -> None:
+        """Process tasks until interrupted (or until the queue is empty if once=True)"""
+        print(f"👷 Worker {self.worker_id} started")
+
+        while True:
+            task = self.broker.claim()
+            if task is None:
+                if once:
+                    return
+                time.sleep(poll_interval)
+                continue
+
+            try:
+                self.run_task(task)
+            except Exception as e:
+                self.fail(task, e)
+
+            self.broker.ack(task)
+
+
+def main():
+    if len(sys.argv) < 2 or sys.argv[1] not in ('work', 'submit', 'status'):
+        print("Usage: python worker.py work")
+        print("       python worker.py submit <audio_file> [interval_seconds]")
+        print("       python worker.py status <job_id>")
+        sys.exit(1)
+
+    broker = get_broker()
+    command = sys.argv[1]
+
+    if command == 'work':
+        try:
+            Worker(broker).run()
+        except KeyboardInterrupt:
+            pass
+
+    elif command == 'submit':
+        if len(sys.argv) < 3 or not os.path.exists(sys.argv[2]):
+            print("Error: File not found")
+            sys.exit(1)
+        interval = int(sys.argv[3]) if len(sys.argv) > 3 else 45
+        print(submit_job(broker, sys.argv[2], interval))
+
+    elif command == 'status':
+        job = broker.get_job(sys.argv[2]) if len(sys.argv) > 2 else None
+        if job is None:
+            print("Error: Job not found")
+            sys.exit(1)
+        print(f"State: {job['state']}")
+        if job['state'] == 'running':
+            print(f"Segments: {broker.count_results(job['id'])} / {job['segments']}")
+        elif job['state'] == 'done':
+            print(job['tracklist'])
+        elif job['state'] == 'failed':
+            print(f"Error: {job.get('error')}")
+
+
+if __name__ == '__main__':
+    main()